@@ -5,8 +5,13 @@ from config import Config
 import redis
 import os
 import time as _time
+from app.utils import json_codec
 
-db = SQLAlchemy()
+# JSON columns are (de)serialized with orjson instead of the stdlib json module
+db = SQLAlchemy(engine_options={
+    'json_serializer': json_codec.dumps,
+    'json_deserializer': json_codec.loads,
+})
 r = None
 
 class MockRedis:
@@ -117,7 +122,7 @@ def create_app(config_class=Config):
     app.register_blueprint(main_bp)
     
     # Import models to ensure they are registered
-    from app.models.analysis import User, Task, TrackingStock, TrackingTransaction, TrackingDailySnapshot, TrackingDecisionLog
+    from app.models.analysis import User, Task, TrackingStock, TrackingTransaction, TrackingDailySnapshot, TrackingDecisionLog, BenchmarkPriceCache
     
     # Register error handlers for API routes to return JSON
     @app.errorhandler(500)
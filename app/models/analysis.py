@@ -1,7 +1,7 @@
 from app import db
+from app.utils import json_codec
 from datetime import datetime
 import uuid
-import json
 import bcrypt
 
 class RecommendationCache(db.Model):
@@ -36,7 +36,7 @@ class AnalysisLog(db.Model):
     market_date = db.Column(db.Date, nullable=False, index=True)  # 分析的市场数据日期（用于判断是否需要重新分析）
     model_name = db.Column(db.String(50), nullable=False)  # 使用的模型名称
     language = db.Column(db.String(10), nullable=False)  # 分析语言
-    analysis_result = db.Column(db.Text, nullable=True)  # JSON string (完整的分析结果，包含 kline_data)
+    analysis_result = db.Column(db.Text, nullable=True)  # JSON string (完整的分析结果，包含 kline_data)，大结果经 json_codec 压缩
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     __table_args__ = (
@@ -76,6 +76,7 @@ class StockTradeSignal(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('symbol', 'date', 'model_name', 'asset_type', name='unique_symbol_date_model_asset'),
+        db.Index('ix_sig_symbol_model_date', 'symbol', 'model_name', 'date'),  # 按模型读取历史 / 最新信号日期
     )
 
     def to_dict(self):
@@ -225,10 +226,10 @@ class Task(db.Model):
     status = db.Column(db.String(20), nullable=False, default='running', index=True)  # 'running', 'completed', 'terminated', 'failed'
     
     # 任务参数
-    task_params = db.Column(db.Text, nullable=True)  # JSON string
+    task_params = db.Column(db.JSON(none_as_null=True), nullable=True)  # 参数 dict，由 SQLAlchemy 序列化（orjson）
     
     # 任务结果
-    task_result = db.Column(db.Text, nullable=True)  # JSON string
+    task_result = db.Column(db.Text, nullable=True)  # JSON string (zlib-compressed when large, see json_codec)
     
     # 错误信息
     error_message = db.Column(db.Text, nullable=True)
@@ -241,20 +242,28 @@ class Task(db.Model):
     # 关联用户
     user = db.relationship('User', backref='tasks')
     
-    def to_dict(self):
-        return {
+    __table_args__ = (
+        # 任务列表：按用户（+状态）筛选并按创建时间倒序，索引逆序扫描即可，无需 filesort
+        db.Index('ix_task_user_status_created', 'user_id', 'status', 'created_at'),
+        db.Index('ix_task_user_created', 'user_id', 'created_at'),
+    )
+    
+    def to_dict(self, include_result=True):
+        data = {
             'id': self.id,
             'task_id': self.task_id,
             'user_id': self.user_id,
             'task_type': self.task_type,
             'status': self.status,
-            'task_params': json.loads(self.task_params) if self.task_params else None,
-            'task_result': json.loads(self.task_result) if self.task_result else None,
+            'task_params': self.task_params,
             'error_message': self.error_message,
             'created_at': self.created_at.isoformat(),
             'started_at': self.started_at.isoformat() if self.started_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
+        if include_result:  # 列表查询时 task_result 被 defer，不访问以免逐行加载
+            data['task_result'] = json_codec.loads_compressed(self.task_result) if self.task_result else None
+        return data
 
 class Portfolio(db.Model):
     """用户虚拟持仓模型"""
@@ -363,6 +372,7 @@ class TrackingStock(db.Model):
     buy_date = db.Column(db.Date, nullable=False, index=True)
     current_price = db.Column(db.Float, nullable=True)  # Latest cached price
     cost_amount = db.Column(db.Float, nullable=True)  # Actual capital invested (may differ from PER_STOCK_ALLOCATION for replacements)
+    shares = db.Column(db.Float, nullable=True)  # cost_amount / buy_price, stored at buy time
     sector = db.Column(db.String(64), nullable=True)  # GICS sector (e.g. Technology, Healthcare)
     industry = db.Column(db.String(128), nullable=True)  # Sub-industry (e.g. Semiconductors)
     reason = db.Column(db.Text, nullable=True)  # AI reasoning for buying
@@ -374,6 +384,12 @@ class TrackingStock(db.Model):
         """Return actual cost amount, defaulting to PER_STOCK_ALLOCATION for legacy records."""
         return self.cost_amount if self.cost_amount is not None else 10000.0
 
+    def get_shares(self):
+        """Return the position size, deriving it from cost and buy price for legacy records."""
+        if self.shares is not None:
+            return self.shares
+        return self.get_cost_amount() / self.buy_price if self.buy_price else 0.0
+
     def to_dict(self):
         cost = self.get_cost_amount()
         unrealized_pct = None
@@ -413,13 +429,29 @@ class TrackingTransaction(db.Model):
     realized_pct = db.Column(db.Float, nullable=True)  # Realized return % (for SELL)
     # For BUY transactions: actual capital invested (may differ from PER_STOCK_ALLOCATION for replacements)
     cost_amount = db.Column(db.Float, nullable=True)
+    # Position size bought (BUY) or sold (SELL): cost_amount / buy price
+    shares = db.Column(db.Float, nullable=True)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Recent SELLs for the decision retrospective (filter on action, newest first)
+        db.Index('ix_tracking_txn_action_date', 'action', 'date'),
+        # Chronological replay / cash aggregation up to a date, ordered by (date, id) without a sort
+        db.Index('ix_tracking_txn_date_id', 'date', 'id'),
+    )
+
     def get_cost_amount(self):
         """Return actual cost amount, defaulting to PER_STOCK_ALLOCATION for legacy records."""
         return self.cost_amount if self.cost_amount is not None else 10000.0
 
+    def get_shares(self):
+        """Return the position size, deriving it from cost and buy price for legacy records."""
+        if self.shares is not None:
+            return self.shares
+        buy_price = self.price if self.action == 'BUY' else self.buy_price
+        return self.get_cost_amount() / buy_price if buy_price else 0.0
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -451,6 +483,11 @@ class TrackingDailySnapshot(db.Model):
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Covers the chart / evaluation reads (date range + return/value), so they never touch holdings_json rows
+        db.Index('ix_tracking_snapshot_date_values', 'date', 'total_return_pct', 'portfolio_value'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -490,23 +527,28 @@ class TrackingDecisionLog(db.Model):
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Newest-first listing and keyset paging on (date, id)
+        db.Index('ix_tracking_decision_date_id', 'date', 'id'),
+    )
+
     def to_dict(self):
         actions = []
         if self.actions_json:
             try:
-                actions = json.loads(self.actions_json)
+                actions = json_codec.loads(self.actions_json)
             except Exception:
                 pass
         report = None
         if self.report_json:
             try:
-                report = json.loads(self.report_json)
+                report = json_codec.loads(self.report_json)
             except Exception:
                 pass
         accuracy_details_parsed = None
         if self.accuracy_details:
             try:
-                accuracy_details_parsed = json.loads(self.accuracy_details)
+                accuracy_details_parsed = json_codec.loads(self.accuracy_details)
             except Exception:
                 pass
         return {
@@ -524,3 +566,20 @@ class TrackingDecisionLog(db.Model):
             'accuracy_details': accuracy_details_parsed,
             'created_at': self.created_at.isoformat()
         }
+
+
+class BenchmarkPriceCache(db.Model):
+    """Cached daily closes of benchmark ETFs (SPY/QQQ) for the tracking comparison chart"""
+    __tablename__ = 'benchmark_price_cache'
+
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(16), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    # Dividend-adjusted close; later downloads are chained onto the cached values so the series stays consistent
+    close = db.Column(db.Float, nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('ticker', 'date', name='unique_benchmark_ticker_date'),
+    )
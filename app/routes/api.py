@@ -6,15 +6,24 @@ from app.models.analysis import AnalysisLog, StockTradeSignal, RecommendationCac
 from app.services.model_config import get_models_for_frontend
 from app.services.task_service import task_service
 from app.services.email_validator import email_validator
+from app.utils.quant_math import pair_signal_trades
+from app.utils.json_codec import dumps_compressed, loads_compressed
 from app import db
+from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import json
 import hashlib
+from collections import namedtuple
 import re
+import sys
 import uuid
 import math
 import os
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 
 api_bp = Blueprint('api', __name__)
 ai_analyzer = AIAnalyzer()
@@ -164,11 +173,80 @@ def get_models():
 
 def get_analysis_status(symbol, model_name):
     """Helper to get the latest analyzed date for a symbol and model"""
-    latest_signal = StockTradeSignal.query.filter_by(
+    # MAX(date) is a single seek on ix_sig_symbol_model_date
+    return db.session.query(db.func.max(StockTradeSignal.date)).filter(
+        StockTradeSignal.symbol == symbol,
+        StockTradeSignal.model_name == model_name
+    ).scalar()
+
+# Shared tag strings for the /analyze reconstruction output. Values read from the DB are fresh
+# str objects per row; mapping them onto these interned constants lets every signal/trade dict
+# reference one object per tag.
+SIGNAL_BUY, SIGNAL_SELL, SIGNAL_HOLD = map(sys.intern, ('BUY', 'SELL', 'HOLD'))
+TRADE_CLOSED, TRADE_HOLDING = map(sys.intern, ('CLOSED', 'HOLDING'))
+_SIGNAL_TAGS = {tag: tag for tag in (SIGNAL_BUY, SIGNAL_SELL, SIGNAL_HOLD)}
+
+def intern_signal_type(signal_type):
+    """Return the shared constant for a BUY/SELL/HOLD tag (unknown tags pass through)."""
+    return _SIGNAL_TAGS.get(signal_type, signal_type)
+
+def load_signal_rows(symbol, model_name, asset_type):
+    """Load a model's signal history as plain column rows (no ORM hydration), oldest first."""
+    return db.session.query(
+        StockTradeSignal.id,
+        StockTradeSignal.date,
+        StockTradeSignal.price,
+        StockTradeSignal.signal_type,
+        StockTradeSignal.reason,
+        StockTradeSignal.adopted
+    ).filter_by(
         symbol=symbol,
-        model_name=model_name
-    ).order_by(StockTradeSignal.date.desc()).first()
-    return latest_signal.date if latest_signal else None
+        model_name=model_name,
+        asset_type=asset_type
+    ).order_by(StockTradeSignal.date.asc()).all()
+
+SignalRow = namedtuple('SignalRow', ['id', 'date', 'price', 'signal_type', 'reason', 'adopted'])
+
+def insert_signals_ignore_duplicates(rows):
+    """
+    Insert signal dicts (all for one symbol/model/asset) in one statement; rows hitting
+    unique_symbol_date_model_asset are skipped by the database instead of being pre-checked
+    with a SELECT each. Returns the inserted rows as SignalRow tuples, in input order.
+    """
+    if not rows:
+        return []
+    table = StockTradeSignal.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        # No-op update on the duplicate key; INSERT IGNORE would also turn truncation /
+        # NOT NULL / FK errors into warnings
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update(id=stmt.table.c.id)
+    elif dialect == 'postgresql':
+        stmt = postgresql_insert(table).on_conflict_do_nothing()
+    else:
+        stmt = sqlite_insert(table).on_conflict_do_nothing()
+
+    if db.engine.dialect.insert_executemany_returning:
+        # SQLite / PostgreSQL: ids of the rows actually inserted come back from the INSERT itself
+        inserted = dict(
+            (row_date, row_id) for row_id, row_date in
+            db.session.execute(stmt.returning(table.c.id, table.c.date), rows)
+        )
+    else:
+        # MySQL has no RETURNING: read the ids of these dates back (id, date only)
+        db.session.execute(stmt, rows)
+        first = rows[0]
+        inserted = dict(db.session.query(StockTradeSignal.date, StockTradeSignal.id).filter(
+            StockTradeSignal.symbol == first['symbol'],
+            StockTradeSignal.model_name == first['model_name'],
+            StockTradeSignal.asset_type == first['asset_type'],
+            StockTradeSignal.date.in_([r['date'] for r in rows])
+        ).all())
+    return [
+        SignalRow(inserted[r['date']], r['date'], r['price'], r['signal_type'], r['reason'], False)
+        for r in rows if r['date'] in inserted
+    ]
 
 def get_current_position(symbol, model_name):
     """
@@ -194,6 +272,19 @@ def get_current_position(symbol, model_name):
                 position = None # Closed
     return position
 
+def build_signal_row(symbol, model_name, asset_type, sig, sig_date):
+    """Column dict for one AI signal, ready for insert_signals_ignore_duplicates."""
+    return {
+        'symbol': symbol,
+        'date': sig_date,
+        'price': sig['price'],
+        'signal_type': sig['type'],  # BUY/SELL
+        'reason': sig.get('reason', ''),
+        'source': 'ai',
+        'model_name': model_name,
+        'asset_type': asset_type
+    }
+
 def get_user_portfolio_context(user_id, current_symbol, asset_type):
     """
     Get user's complete portfolio information for AI analysis context.
@@ -475,7 +566,7 @@ def analyze():
         return jsonify({'error': 'Empty market data'}), 404
         
     latest_market_date_str = market_dates[-1]
-    latest_market_date = datetime.strptime(latest_market_date_str, '%Y-%m-%d').date()
+    latest_market_date = date.fromisoformat(latest_market_date_str)
     
     # --- 检查 MySQL 是否已有当天的分析记录 ---
     existing_log = AnalysisLog.query.filter_by(
@@ -488,9 +579,9 @@ def analyze():
     if existing_log and existing_log.analysis_result:
         print(f"[{symbol}] Using cached analysis from MySQL for {latest_market_date_str}")
         try:
-            cached_data = json.loads(existing_log.analysis_result)
+            cached_data = loads_compressed(existing_log.analysis_result)
             return jsonify(cached_data)
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             print(f"JSON decode error for existing log: {e}, re-analyzing...")
             # 如果 JSON 损坏，删除旧记录并重新分析
             db.session.delete(existing_log)
@@ -539,6 +630,7 @@ def analyze():
     # --- AI PERSISTENCE LOGIC ---
     
     new_signals = []
+    signal_rows = None  # In-memory signal history; None means read it back from DB
     should_cache = True  # 默认允许缓存（从DB读取历史数据时）
     
     if not latest_analyzed_date:
@@ -554,32 +646,23 @@ def analyze():
         
         if full_analysis.get('source') == 'ai_agent':
             # AI 分析成功，保存信号到 DB（按模型分开存储）
+            rows_by_date = {}
             for sig in full_analysis.get('signals', []):
                 try:
-                    # Check if signal already exists (shouldn't for new init, but safe check)
-                    sig_date = datetime.strptime(sig['date'], '%Y-%m-%d').date()
-                    exists = StockTradeSignal.query.filter_by(
-                        symbol=symbol,
-                        date=sig_date,
-                        model_name=model_name,
-                        asset_type=asset_type
-                    ).first()
-                    if not exists:
-                        new_signal = StockTradeSignal(
-                            symbol=symbol,
-                            date=sig_date,
-                            price=sig['price'],
-                            signal_type=sig['type'], # BUY/SELL
-                            reason=sig.get('reason', ''),
-                            source='ai',
-                            model_name=model_name,
-                            asset_type=asset_type
-                        )
-                        db.session.add(new_signal)
+                    sig_date = date.fromisoformat(sig['date'])
+                    # Keep the first signal per day; rows already in DB are skipped by INSERT IGNORE
+                    if sig_date not in rows_by_date:
+                        rows_by_date[sig_date] = build_signal_row(symbol, model_name, asset_type, sig, sig_date)
                 except Exception as e:
                     print(f"Error saving signal: {e}")
+            new_signals = [rows_by_date[d] for d in sorted(rows_by_date)]
             try:
+                inserted_rows = insert_signals_ignore_duplicates(new_signals)
                 db.session.commit()
+                # No prior history, so the new signals are the full history
+                # (unless a concurrent request stored some of these dates first: then read it back)
+                if len(inserted_rows) == len(new_signals):
+                    signal_rows = inserted_rows
                 print(f"[{symbol}] Full history saved.")
             except Exception as e:
                 db.session.rollback()
@@ -603,6 +686,7 @@ def analyze():
         
         if latest_market_date > latest_analyzed_date:
             print(f"[{symbol}] Incremental update needed.")
+            existing_rows = load_signal_rows(symbol, model_name, asset_type)
             # Agent mode: AI fetches its own data via tool calls
             fresh_analysis = ai_analyzer.analyze_with_agent(
                 symbol, 
@@ -614,46 +698,41 @@ def analyze():
             
             if fresh_analysis.get('source') == 'ai_agent':
                 # AI 分析成功，保存新信号到 DB（按模型分开存储）
+                rows_by_date = {}
                 for sig in fresh_analysis.get('signals', []):
-                    sig_date = datetime.strptime(sig['date'], '%Y-%m-%d').date()
-                    if sig_date > latest_analyzed_date:
-                        # This is a NEW signal
-                        try:
-                            new_signal = StockTradeSignal(
-                                symbol=symbol,
-                                date=sig_date,
-                                price=sig['price'],
-                                signal_type=sig['type'],
-                                reason=sig.get('reason', ''),
-                                source='ai',
-                                model_name=model_name,
-                                asset_type=asset_type
-                            )
-                            db.session.add(new_signal)
+                    try:
+                        sig_date = date.fromisoformat(sig['date'])
+                        if sig_date > latest_analyzed_date and sig_date not in rows_by_date:
+                            # This is a NEW signal
+                            rows_by_date[sig_date] = build_signal_row(symbol, model_name, asset_type, sig, sig_date)
                             print(f"[{symbol}] New signal added for {model_name}: {sig_date} {sig['type']}")
-                        except Exception as e:
-                            print(f"Error adding signal: {e}")
+                    except Exception as e:
+                        print(f"Error adding signal: {e}")
+                new_signals = [rows_by_date[d] for d in sorted(rows_by_date)]
                 try:
+                    inserted_rows = insert_signals_ignore_duplicates(new_signals)
                     db.session.commit()
+                    # New signals are all dated after the existing history
+                    if len(inserted_rows) == len(new_signals):
+                        signal_rows = existing_rows + inserted_rows
                 except Exception as e:
                     db.session.rollback()
             else:
+                signal_rows = existing_rows
                 # AI 失败，降级到本地策略，不缓存本次结果
                 should_cache = False
                 print(f"[{symbol}] AI analysis failed during incremental update, local strategy used. Will not cache.")
 
-    # 3. Construct Final Response from DB
-    # Now we read the "Model-specific History" from DB to ensure consistency for each model
+    # 3. Construct Final Response
+    # Reuse the in-memory "Model-specific History" built above; only read it back from DB
+    # when nothing was written (history up to date) or the write failed.
     
     # Get current user for checking adopted signals
     user = get_user_from_request()
     user_id = user.id if user else None
     
-    db_signals = StockTradeSignal.query.filter_by(
-        symbol=symbol,
-        model_name=model_name,
-        asset_type=asset_type
-    ).order_by(StockTradeSignal.date.asc()).all()
+    if signal_rows is None:
+        signal_rows = load_signal_rows(symbol, model_name, asset_type)
     
     # Get user's real transactions for this symbol
     user_transactions = []
@@ -671,79 +750,64 @@ def analyze():
     
     # Reconstruct 'trades' (pair of Buy/Sell) from signals for the UI
     reconstructed_trades = []
-    current_position = None # {date, price, reason}
-    
-    ui_signals = []
     user_trade_signals = []  # User's real transactions for chart display
     
-    # Process AI signals
-    for s in db_signals:
-        date_str = s.date.strftime('%Y-%m-%d')
-        
-        # Add to signals list for chart
-        ui_signals.append({
-            "type": s.signal_type,
-            "date": date_str,
-            "price": s.price,
-            "reason": s.reason,
-            "adopted": s.adopted,
-            "signal_id": s.id
+    # Process AI signals as parallel arrays
+    sig_dates = np.array([row.date for row in signal_rows], dtype='datetime64[D]')
+    sig_prices = np.array([row.price for row in signal_rows], dtype=float)
+    type_tags = [intern_signal_type(row.signal_type) for row in signal_rows]
+    sig_types = np.array(type_tags, dtype=object)
+    date_strs = np.datetime_as_string(sig_dates, unit='D').tolist()
+    
+    # Add to signals list for chart
+    ui_signals = [{
+        "type": type_tags[i],
+        "date": date_strs[i],
+        "price": row.price,
+        "reason": row.reason,
+        "adopted": row.adopted,
+        "signal_id": row.id
+    } for i, row in enumerate(signal_rows)]
+    
+    # Logic to pair trades
+    buy_idx, sell_idx, open_buy_idx = pair_signal_trades(sig_types)
+    buy_prices = sig_prices[buy_idx]
+    returns = (sig_prices[sell_idx] - buy_prices) / buy_prices * 100
+    holding_days = (sig_dates[sell_idx] - sig_dates[buy_idx]).astype(int)
+    for b, s, ret_pct, days in zip(buy_idx.tolist(), sell_idx.tolist(), returns.tolist(), holding_days.tolist()):
+        reconstructed_trades.append({
+            "buy_date": date_strs[b],
+            "buy_price": round(signal_rows[b].price, 2),
+            "sell_date": date_strs[s],
+            "sell_price": round(signal_rows[s].price, 2),
+            "status": TRADE_CLOSED,
+            "holding_period": f"{days} days",
+            "return_rate": f"{ret_pct:+.2f}%",
+            "reason": signal_rows[s].reason # Use sell reason
         })
-        
-        # Logic to pair trades
-        if s.signal_type == 'BUY':
-            if current_position is None:
-                current_position = {
-                    'buy_date': date_str,
-                    'buy_price': s.price,
-                    'buy_reason': s.reason
-                }
-        elif s.signal_type == 'SELL':
-            if current_position:
-                # Close position
-                buy_price = current_position['buy_price']
-                sell_price = s.price
-                ret_pct = ((sell_price - buy_price) / buy_price) * 100
-                
-                # Calculate days
-                d1 = datetime.strptime(current_position['buy_date'], '%Y-%m-%d')
-                d2 = s.date
-                days = (datetime.combine(d2, datetime.min.time()) - d1).days
-                
-                reconstructed_trades.append({
-                    "buy_date": current_position['buy_date'],
-                    "buy_price": round(buy_price, 2),
-                    "sell_date": date_str,
-                    "sell_price": round(sell_price, 2),
-                    "status": "CLOSED",
-                    "holding_period": f"{days} days",
-                    "return_rate": f"{ret_pct:+.2f}%",
-                    "reason": s.reason # Use sell reason
-                })
-                current_position = None
                 
     # Handle open position
-    if current_position:
+    if open_buy_idx is not None:
         # Get latest price from kline_data
         latest_close = kline_data[-1]['close']
         latest_date_str = kline_data[-1]['date']
         
-        buy_price = current_position['buy_price']
+        buy_price = signal_rows[open_buy_idx].price
         curr_ret = ((latest_close - buy_price) / buy_price) * 100
         
-        d1 = datetime.strptime(current_position['buy_date'], '%Y-%m-%d')
-        d2 = datetime.strptime(latest_date_str, '%Y-%m-%d')
+        d1 = signal_rows[open_buy_idx].date
+        d2 = date.fromisoformat(latest_date_str)
         days = (d2 - d1).days
         
         reconstructed_trades.append({
-            "buy_date": current_position['buy_date'],
+            "buy_date": date_strs[open_buy_idx],
             "buy_price": round(buy_price, 2),
             "sell_date": None,
             "sell_price": None,
-            "status": "HOLDING",
+            "status": TRADE_HOLDING,
             "holding_period": f"{days} days",
             "return_rate": f"{curr_ret:+.2f}% (Open)",
-            "reason": current_position['buy_reason']
+            "reason": signal_rows[open_buy_idx].reason
         })
         
     # Sort desc for UI
@@ -752,7 +816,7 @@ def analyze():
     # Process user's real transactions for chart display
     for trans in user_transactions:
         user_trade_signals.append({
-            "type": trans.transaction_type,
+            "type": intern_signal_type(trans.transaction_type),
             "date": trans.trade_date.strftime('%Y-%m-%d'),
             "price": trans.price,
             "quantity": trans.quantity,
@@ -779,7 +843,7 @@ def analyze():
         ).order_by(AnalysisLog.created_at.desc()).first()
         if last_log and last_log.analysis_result:
             try:
-                summary_text = json.loads(last_log.analysis_result).get('analysis_summary', summary_text)
+                summary_text = loads_compressed(last_log.analysis_result).get('analysis_summary', summary_text)
             except:
                 pass
 
@@ -816,14 +880,14 @@ def analyze():
                     market_date=latest_market_date,
                     model_name=model_name,
                     language=language,
-                    analysis_result=json.dumps(final_response)
+                    analysis_result=dumps_compressed(final_response)
                 )
                 db.session.add(new_log)
                 db.session.commit()
                 print(f"[{symbol}] Analysis result saved to MySQL for {latest_market_date_str}")
             else:
                 # 更新已有记录
-                existing.analysis_result = json.dumps(final_response)
+                existing.analysis_result = dumps_compressed(final_response)
                 existing.created_at = datetime.utcnow()
                 db.session.commit()
                 print(f"[{symbol}] Analysis result updated in MySQL for {latest_market_date_str}")
@@ -1489,6 +1553,12 @@ def get_task(task_id):
     if not task:
         return jsonify({'error': '任务不存在'}), 404
     
+    # 客户端通过 If-None-Match 带上已缓存 K 线的 hash，相同则不再返回 kline_data
+    known_kline_hash = request.headers.get('If-None-Match', '').strip('"')
+    result = task.get('task_result')
+    if known_kline_hash and isinstance(result, dict) and result.get('kline_hash') == known_kline_hash:
+        task['task_result'] = {**result, 'kline_data': None, 'kline_data_unchanged': True}
+    
     return jsonify(task)
 
 @api_bp.route('/tasks', methods=['GET'])
@@ -1547,7 +1617,7 @@ def analyze_async():
     
     if existing_task:
         try:
-            task_params = json.loads(existing_task.task_params) if existing_task.task_params else {}
+            task_params = existing_task.task_params or {}
             existing_symbol = task_params.get('symbol')
             existing_model = task_params.get('model', 'gemini-3-flash-preview')
             
@@ -1753,7 +1823,7 @@ def refresh_portfolios():
         
         # 获取标的全名 (uses local list first, avoids yf.Ticker().info)
         try:
-            name = DataProvider.get_symbol_name(
+            name = batch_fetcher.get_cached_symbol_name(
                 p.symbol, 
                 asset_type=p.asset_type,
                 currency=p.currency
@@ -1822,7 +1892,10 @@ def get_portfolio(portfolio_id):
     if not user:
         return jsonify({'error': '未登录'}), 401
     
-    portfolio = Portfolio.query.filter_by(id=portfolio_id, user_id=user.id).first()
+    # 持仓与交易记录一次查询取回（JOIN），避免访问 portfolio.transactions 时再懒加载
+    portfolio = Portfolio.query.options(joinedload(Portfolio.transactions)).filter_by(
+        id=portfolio_id, user_id=user.id
+    ).first()
     if not portfolio:
         return jsonify({'error': '持仓不存在'}), 404
     
@@ -2626,14 +2699,37 @@ def tracking_holdings():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _next_page_cursor(rows, limit):
+    """下一页的 keyset 游标（最后一行的 date/id）；不足一页说明已到末尾，返回 None"""
+    if not rows or len(rows) < limit:
+        return None
+    return {'before': rows[-1]['date'], 'before_id': rows[-1]['id']}
+
+def _parse_page_cursor():
+    """解析 keyset 游标参数：before 为 YYYY-MM-DD，before_id 为整数；格式错误时抛出 ValueError"""
+    before = request.args.get('before') or None  # keyset cursor: date of the last row received
+    before_id = request.args.get('before_id') or None
+    try:
+        if before is not None:
+            datetime.strptime(before, '%Y-%m-%d')
+        if before_id is not None:
+            before_id = int(before_id)
+    except ValueError:
+        raise ValueError('Invalid cursor: before must be YYYY-MM-DD and before_id an integer')
+    return before, before_id
+
 @api_bp.route('/tracking/transactions', methods=['GET'])
 def tracking_transactions():
     """Get tracking transaction history."""
     from app.services.tracking_service import tracking_service
     limit = request.args.get('limit', 50, type=int)
     try:
-        txns = tracking_service.get_transaction_history(limit=limit)
-        return jsonify({'transactions': txns})
+        before, before_id = _parse_page_cursor()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        txns = tracking_service.get_transaction_history(limit=limit, before=before, before_id=before_id)
+        return jsonify({'transactions': txns, 'next_cursor': _next_page_cursor(txns, limit)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2643,8 +2739,12 @@ def tracking_decisions():
     from app.services.tracking_service import tracking_service
     limit = request.args.get('limit', 30, type=int)
     try:
-        logs = tracking_service.get_decision_logs(limit=limit)
-        return jsonify({'decisions': logs})
+        before, before_id = _parse_page_cursor()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        logs = tracking_service.get_decision_logs(limit=limit, before=before, before_id=before_id)
+        return jsonify({'decisions': logs, 'next_cursor': _next_page_cursor(logs, limit)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -4,9 +4,24 @@ Defines tools that AI models can call during analysis to fetch real-time data.
 """
 
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from app.services.data_provider import DataProvider, batch_fetcher
 from app.utils.quant_math import calculate_indicators
+from app.utils.log_queue import get_logger
+
+logger = get_logger(__name__)
+
+# Max concurrent data fetches within one batch tool call (matches BatchFetcher's 5 req/s limiter)
+BATCH_FETCH_WORKERS = 5
+
+
+def _fetch_concurrently(fetch_fn, symbols):
+    """Run blocking fetch_fn(symbol) for each symbol on a small thread pool, preserving order."""
+    if len(symbols) <= 1:
+        return [fetch_fn(sym) for sym in symbols]
+    with ThreadPoolExecutor(max_workers=min(BATCH_FETCH_WORKERS, len(symbols))) as pool:
+        return list(pool.map(fetch_fn, symbols))
 
 
 # ============================================================
@@ -218,17 +233,22 @@ TOOL_DEFINITIONS = [
 # Tool Execution Functions
 # ============================================================
 
+class AgentCancelled(Exception):
+    """Raised at the next tool call once the task running the agent has been terminated."""
+
+
 class AgentToolExecutor:
     """
     Executes tool calls from AI models.
     Maintains context (user_id, current symbol, etc.) for data access.
     """
 
-    def __init__(self, user_id=None, current_symbol=None, asset_type="STOCK", provider=None):
+    def __init__(self, user_id=None, current_symbol=None, asset_type="STOCK", provider=None, stop_event=None):
         self.user_id = user_id
         self.current_symbol = current_symbol
         self.asset_type = asset_type
         self.provider = provider  # Current model provider: gemini/qwen/openai/anthropic
+        self.stop_event = stop_event  # threading.Event set when the owning task is terminated
         self._tool_call_log = []  # Track all tool calls for UI display
         self._trace = []  # Chronological trace: thinking + tool_call entries
 
@@ -261,7 +281,13 @@ class AgentToolExecutor:
             
         Returns:
             String result to feed back to the AI model
+
+        Raises:
+            AgentCancelled: If stop_event is set (aborts the agent loop between model calls)
         """
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise AgentCancelled(f"Agent stopped before tool call: {tool_name}")
+
         start_time = datetime.now()
 
         try:
@@ -591,11 +617,14 @@ class AgentToolExecutor:
         if len(symbols) > 10:
             symbols = symbols[:10]
 
-        results = []
-        for sym in symbols:
-            price = batch_fetcher.get_cached_current_price(sym)
-            daily_change = batch_fetcher.get_cached_daily_change(sym)
+        quotes = _fetch_concurrently(
+            lambda sym: (batch_fetcher.get_cached_current_price(sym),
+                         batch_fetcher.get_cached_daily_change(sym)),
+            symbols
+        )
 
+        results = []
+        for sym, (price, daily_change) in zip(symbols, quotes):
             results.append({
                 "symbol": sym,
                 "price": price,
@@ -615,14 +644,16 @@ class AgentToolExecutor:
         effective_type = asset_type or self.asset_type
         currency = "CNY" if effective_type == "FUND_CN" else None
 
+        quotes = _fetch_concurrently(
+            lambda sym: (
+                batch_fetcher.get_cached_current_price(sym, asset_type=effective_type, currency=currency),
+                batch_fetcher.get_cached_daily_change(sym, asset_type=effective_type, currency=currency)
+            ),
+            symbols
+        )
+
         results = []
-        for sym in symbols:
-            price = batch_fetcher.get_cached_current_price(
-                sym, asset_type=effective_type, currency=currency
-            )
-            daily_change = batch_fetcher.get_cached_daily_change(
-                sym, asset_type=effective_type, currency=currency
-            )
+        for sym, (price, daily_change) in zip(symbols, quotes):
             results.append({
                 "symbol": sym,
                 "price": price,
@@ -660,9 +691,9 @@ class AgentToolExecutor:
             try:
                 result_text = search_fn()
                 if result_text:
-                    print(f"  [search_market_news] ✅ {name} search succeeded ({len(result_text)} chars)")
+                    logger.info("  [search_market_news] ✅ %s search succeeded (%s chars)", name, len(result_text))
             except Exception as e:
-                print(f"  [search_market_news] {name} search failed: {e}")
+                logger.warning("  [search_market_news] %s search failed: %s", name, e)
 
         if not result_text:
             return json.dumps({
@@ -681,6 +712,7 @@ class AgentToolExecutor:
     def _build_search_strategies(self, search_prompt):
         """Build ordered list of (name, callable) search strategies based on current provider."""
         import os
+        from app.services.model_adapters import get_shared_client
 
         def gemini_search():
             gemini_key = os.getenv('GEMINI_API_KEY')
@@ -688,7 +720,7 @@ class AgentToolExecutor:
                 return None
             from google import genai
             from google.genai import types
-            client = genai.Client(api_key=gemini_key)
+            client = get_shared_client('gemini', gemini_key, lambda: genai.Client(api_key=gemini_key))
             response = client.models.generate_content(
                 model="gemini-2.0-flash",
                 contents=search_prompt,
@@ -703,10 +735,10 @@ class AgentToolExecutor:
             if not qwen_key:
                 return None
             from openai import OpenAI
-            client = OpenAI(
+            client = get_shared_client('qwen', qwen_key, lambda: OpenAI(
                 api_key=qwen_key,
                 base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-            )
+            ))
             response = client.chat.completions.create(
                 model="qwen-plus",
                 messages=[{"role": "user", "content": search_prompt}],
@@ -725,7 +757,7 @@ class AgentToolExecutor:
             if not openai_key:
                 return None
             from openai import OpenAI
-            client = OpenAI(api_key=openai_key)
+            client = get_shared_client('openai', openai_key, lambda: OpenAI(api_key=openai_key))
             response = client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": search_prompt}],
@@ -748,10 +780,10 @@ class AgentToolExecutor:
             primary = provider_search_map[self.provider]
             fallbacks = [s for s in all_strategies if s[0] != primary[0]]
             strategies = [primary] + fallbacks
-            print(f"  [search_market_news] Provider={self.provider}, search order: {[s[0] for s in strategies]}")
+            logger.info("  [search_market_news] Provider=%s, search order: %s", self.provider, [s[0] for s in strategies])
         else:
             strategies = all_strategies
-            print(f"  [search_market_news] No provider set, using default search order: {[s[0] for s in strategies]}")
+            logger.info("  [search_market_news] No provider set, using default search order: %s", [s[0] for s in strategies])
 
         return strategies
 
@@ -763,12 +795,15 @@ class AgentToolExecutor:
         effective_type = asset_type or self.asset_type
         is_cn_fund = effective_type == "FUND_CN"
 
-        results = []
-        for sym in symbols:
-            data = batch_fetcher.get_cached_kline_data(
+        klines = _fetch_concurrently(
+            lambda sym: batch_fetcher.get_cached_kline_data(
                 sym, period=period, interval="1d", is_cn_fund=is_cn_fund
-            )
+            ),
+            symbols
+        )
 
+        results = []
+        for sym, data in zip(symbols, klines):
             if not data:
                 results.append({
                     "symbol": sym,
@@ -819,12 +854,15 @@ class AgentToolExecutor:
         effective_type = self.asset_type
         is_cn_fund = effective_type == "FUND_CN"
 
-        results = []
-        for sym in symbols:
-            data = batch_fetcher.get_cached_kline_data(
+        klines = _fetch_concurrently(
+            lambda sym: batch_fetcher.get_cached_kline_data(
                 sym, period=period, interval="1d", is_cn_fund=is_cn_fund
-            )
+            ),
+            symbols
+        )
 
+        results = []
+        for sym, data in zip(symbols, klines):
             if not data:
                 results.append({
                     "symbol": sym,
@@ -2,12 +2,24 @@ import re
 import os
 import json
 import time
+from functools import cached_property
 from flask import current_app
 from app.utils.quant_math import calculate_indicators
 from datetime import datetime
 from app.services.technical_strategy import TechnicalStrategy
 from app.services.model_adapters import get_adapter
 from app.services.model_config import get_model_config
+from app.services.agent_tools import AgentCancelled
+from app.utils.log_queue import format_fields, get_logger
+
+logger = get_logger(__name__)
+
+
+def _format_usage(usage, template):
+    """Token usage line for a log record, or '' when the adapter reported none."""
+    if not usage:
+        return ''
+    return template % (usage.get('input_tokens', 'N/A'), usage.get('output_tokens', 'N/A'))
 
 
 # ============================================================
@@ -121,7 +133,7 @@ class AIAnalyzer:
             try:
                 self._adapters[model_id] = get_adapter(model_id)
             except Exception as e:
-                print(f"Failed to get adapter for {model_id}: {e}")
+                logger.warning("Failed to get adapter for %s: %s", model_id, e)
                 return None
         return self._adapters[model_id]
 
@@ -144,18 +156,20 @@ class AIAnalyzer:
             return False, config, None
         return True, config, adapter
 
-    def _create_tool_executor(self, user_id=None, symbol=None, asset_type="STOCK", provider=None):
+    def _create_tool_executor(self, user_id=None, symbol=None, asset_type="STOCK", provider=None, stop_event=None):
         """Create an AgentToolExecutor with the given context."""
         from app.services.agent_tools import AgentToolExecutor
         return AgentToolExecutor(
             user_id=user_id,
             current_symbol=symbol,
             asset_type=asset_type,
-            provider=provider
+            provider=provider,
+            stop_event=stop_event
         )
 
-    def _get_tool_descriptions_text(self):
-        """Build a human-readable list of available tools for inclusion in prompts."""
+    @cached_property
+    def _tool_descriptions_text(self):
+        """Human-readable list of available tools for inclusion in prompts (built once per analyzer)."""
         from app.services.agent_tools import TOOL_DEFINITIONS
         return "\n".join(
             f"- **{t['name']}**: {t['description']}" for t in TOOL_DEFINITIONS
@@ -188,14 +202,14 @@ class AIAnalyzer:
         try:
             return json.loads(json_text)
         except json.JSONDecodeError as first_err:
-            print(f"[JSON Parse] First attempt failed: {first_err}")
+            logger.warning("[JSON Parse] First attempt failed: %s", first_err)
 
         # Step 3: Apply common fixes and retry
         repaired = self._repair_json_text(json_text)
         try:
             return json.loads(repaired)
         except json.JSONDecodeError as second_err:
-            print(f"[JSON Parse] Second attempt (after repair) failed: {second_err}")
+            logger.warning("[JSON Parse] Second attempt (after repair) failed: %s", second_err)
 
         # Step 4: Try to find and parse the largest valid JSON object via balanced braces
         balanced = self._extract_balanced_json(json_text)
@@ -288,12 +302,9 @@ class AIAnalyzer:
             ValueError: If the response is empty
         """
         start_time = time.time()
-        print(f"\n{'='*60}")
-        print(f"[{label}] Starting agent-mode call")
-        if max_iterations:
-            print(f"  max_iterations: {max_iterations}")
-        for k, v in log_extra.items():
-            print(f"  {k}: {v}")
+        fields = {'max_iterations': max_iterations} if max_iterations else {}
+        fields.update(log_extra)
+        logger.info("[%s] Starting agent-mode call%s", label, format_fields(fields))
 
         gen_kwargs = {}
         if max_iterations:
@@ -304,11 +315,8 @@ class AIAnalyzer:
         if not text:
             raise ValueError(f"Empty response from AI agent ({label})")
 
-        print(f"[{label}] \u2705 Completed")
-        print(f"  Time: {elapsed:.2f}s | Tool calls: {len(tool_executor.tool_calls)}")
-        if usage:
-            print(f"  Tokens: in={usage.get('input_tokens','N/A')}, out={usage.get('output_tokens','N/A')}")
-        print(f"{'='*60}\n")
+        logger.info("[%s] \u2705 Completed\n  Time: %.2fs | Tool calls: %s%s", label, elapsed,
+                    len(tool_executor.tool_calls), _format_usage(usage, "\n  Tokens: in=%s, out=%s"))
 
         return text, usage, elapsed
 
@@ -402,7 +410,7 @@ class AIAnalyzer:
         )
 
     def analyze_with_agent(self, symbol, model_name="gemini-3-flash-preview", language="zh",
-                           asset_type="STOCK", symbol_name=None, user_id=None):
+                           asset_type="STOCK", symbol_name=None, user_id=None, stop_event=None):
         """
         Agent-mode K-line analysis using function calling.
         The AI model actively calls tools to fetch real-time price, kline,
@@ -413,10 +421,12 @@ class AIAnalyzer:
         if not supports:
             raise ValueError(f"Model {model_name} does not support tool calling")
 
-        tool_executor = self._create_tool_executor(user_id, symbol, asset_type, provider=config.get('provider'))
+        tool_executor = self._create_tool_executor(
+            user_id, symbol, asset_type, provider=config.get('provider'), stop_event=stop_event
+        )
         lang_instruction = "Respond in Chinese (Simplified)." if language == 'zh' else "Respond in English."
         role, asset_name, focus = ASSET_ROLE_MAP.get(asset_type, ASSET_ROLE_MAP['STOCK'])
-        tool_descriptions = self._get_tool_descriptions_text()
+        tool_descriptions = self._tool_descriptions_text
 
         if language == 'en':
             decision_matrix_text = """**ENTRY DECISION MATRIX (for BUY/ADD -- when EMPTY or adding to HOLDING)**:
@@ -566,8 +576,10 @@ CHECK 3 -- Valuation & Macro Anchor (from price history + fundamentals + news):
             result['agent_trace'] = tool_executor.trace
             return result
 
+        except AgentCancelled:
+            raise
         except Exception as e:
-            print(f"[KlineAgent] ❌ Failed: {e}, falling back to local strategy")
+            logger.error("[KlineAgent] ❌ Failed: %s, falling back to local strategy", e)
             # Fallback: local technical strategy
             enriched_data = []
             try:
@@ -579,7 +591,7 @@ CHECK 3 -- Valuation & Macro Anchor (from price history + fundamentals + news):
                 if kline_data:
                     enriched_data = calculate_indicators(kline_data)
             except Exception as fetch_err:
-                print(f"[KlineAgent] Data fetch also failed: {fetch_err}")
+                logger.warning("[KlineAgent] Data fetch also failed: %s", fetch_err)
 
             if enriched_data:
                 result = TechnicalStrategy.analyze(
@@ -595,7 +607,7 @@ CHECK 3 -- Valuation & Macro Anchor (from price history + fundamentals + news):
 
             return self._agent_error_result(str(e), tool_executor, language)
 
-    def recommend_stocks_with_agent(self, criteria, model_name="gemini-3-flash-preview", language="zh"):
+    def recommend_stocks_with_agent(self, criteria, model_name="gemini-3-flash-preview", language="zh", stop_event=None):
         """
         Agent-mode market recommendation using function calling.
         The AI proactively fetches real-time market data via tools to inform its picks.
@@ -605,9 +617,11 @@ CHECK 3 -- Valuation & Macro Anchor (from price history + fundamentals + news):
             raise ValueError(f"Model {model_name} does not support tool calling")
 
         asset_type = criteria.get('asset_type', 'STOCK')
-        tool_executor = self._create_tool_executor(asset_type=asset_type, provider=config.get('provider'))
+        tool_executor = self._create_tool_executor(
+            asset_type=asset_type, provider=config.get('provider'), stop_event=stop_event
+        )
         lang_instruction = "Respond in Chinese (Simplified)." if language == 'zh' else "Respond in English."
-        tool_descriptions = self._get_tool_descriptions_text()
+        tool_descriptions = self._tool_descriptions_text
         role, asset_name, focus = ASSET_ROLE_MAP.get(asset_type, ASSET_ROLE_MAP['STOCK'])
 
         current_date = datetime.now().strftime('%Y-%m-%d')
@@ -731,8 +745,10 @@ Do NOT start by picking well-known blue-chip stocks -- that is "drawing the targ
             result['source'] = 'ai_agent'
             return result
 
+        except AgentCancelled:
+            raise
         except Exception as e:
-            print(f"[RecommendAgent] ❌ Failed: {e}")
+            logger.error("[RecommendAgent] ❌ Failed: %s", e)
             return {
                 "market_overview": f"Analysis failed: {str(e)}",
                 "recommendations": [],
@@ -743,7 +759,7 @@ Do NOT start by picking well-known blue-chip stocks -- that is "drawing the targ
             }
 
     def analyze_portfolio_item_with_agent(self, holding_data, model_name="gemini-3-flash-preview",
-                                           language="zh", user_id=None):
+                                           language="zh", user_id=None, stop_event=None):
         """
         Agent-mode single-holding diagnosis using function calling.
         The AI fetches real-time data for the symbol before making its recommendation.
@@ -755,9 +771,11 @@ Do NOT start by picking well-known blue-chip stocks -- that is "drawing the targ
         if not supports:
             raise ValueError(f"Model {model_name} does not support tool calling")
 
-        tool_executor = self._create_tool_executor(user_id, symbol, asset_type, provider=config.get('provider'))
+        tool_executor = self._create_tool_executor(
+            user_id, symbol, asset_type, provider=config.get('provider'), stop_event=stop_event
+        )
         lang_instruction = "Respond in Chinese (Simplified)." if language == 'zh' else "Respond in English."
-        tool_descriptions = self._get_tool_descriptions_text()
+        tool_descriptions = self._tool_descriptions_text
         role, asset_name, focus = ASSET_ROLE_MAP.get(asset_type, ASSET_ROLE_MAP['STOCK'])
 
         avg_price = holding_data.get('avg_price', 'Unknown')
@@ -898,8 +916,10 @@ CHECK 3 -- Valuation & P&L Context:
             result['source'] = 'ai_agent'
             return result
 
+        except AgentCancelled:
+            raise
         except Exception as e:
-            print(f"[DiagnosisAgent] ❌ Failed: {e}")
+            logger.error("[DiagnosisAgent] ❌ Failed: %s", e)
             return {
                 "symbol": symbol,
                 "rating": "Unknown",
@@ -1086,15 +1106,12 @@ CHECK 3 -- Valuation & P&L Context:
         try:
             # Start timing
             start_time = time.time()
-            print(f"\n{'='*60}")
-            print(f"[LLM DEBUG] Starting full portfolio analysis")
-            print(f"  Model: {model_name}")
-            print(f"  Provider: {config.get('provider', 'unknown')}")
-            print(f"  Language: {language}")
-            print(f"  Total positions: {len(positions)}")
-            print(f"  Total value: ${total_value:,.2f}")
-            print(f"  Total P&L: ${total_pnl:,.2f} ({total_pnl_pct:+.2f}%)")
-            print(f"  Supports search: {supports_search}")
+            logger.info(
+                "[LLM DEBUG] Starting full portfolio analysis\n  Model: %s\n  Provider: %s\n  Language: %s\n"
+                "  Total positions: %s\n  Total value: $%.2f\n  Total P&L: $%.2f (%+.2f%%)\n  Supports search: %s",
+                model_name, config.get('provider', 'unknown'), language, len(positions),
+                total_value, total_pnl, total_pnl_pct, supports_search
+            )
             
             # Use unified adapter interface
             text, usage = adapter.generate(prompt, use_search=supports_search)
@@ -1108,22 +1125,18 @@ CHECK 3 -- Valuation & P&L Context:
             result = self._parse_json_response(text)
             
             # Print success log
-            print(f"[LLM DEBUG] ✅ Full portfolio analysis completed successfully")
-            print(f"  Total time: {elapsed_time:.2f}s")
-            print(f"  Overall rating: {result.get('overall_rating', 'N/A')}")
-            print(f"  Risk level: {result.get('risk_level', 'N/A')}")
-            print(f"  Response length: {len(text)} chars")
-            if usage:
-                print(f"  Token usage: input={usage.get('input_tokens', 'N/A')}, output={usage.get('output_tokens', 'N/A')}")
-            print(f"{'='*60}\n")
+            logger.info(
+                "[LLM DEBUG] ✅ Full portfolio analysis completed successfully\n  Total time: %.2fs\n"
+                "  Overall rating: %s\n  Risk level: %s\n  Response length: %s chars%s",
+                elapsed_time, result.get('overall_rating', 'N/A'), result.get('risk_level', 'N/A'), len(text),
+                _format_usage(usage, "\n  Token usage: input=%s, output=%s")
+            )
             
             return result
         except Exception as e:
             elapsed_time = time.time() - start_time if 'start_time' in locals() else 0
-            print(f"[LLM DEBUG] ❌ Full portfolio analysis failed")
-            print(f"  Total time: {elapsed_time:.2f}s")
-            print(f"  Error: {str(e)}")
-            print(f"{'='*60}\n")
+            logger.error("[LLM DEBUG] ❌ Full portfolio analysis failed\n  Total time: %.2fs\n  Error: %s",
+                         elapsed_time, e)
             return {
                 "overall_rating": "Unknown",
                 "total_score": 0,
@@ -1152,12 +1165,11 @@ CHECK 3 -- Valuation & P&L Context:
             # Start timing
             start_time = time.time()
             config = get_model_config(model_name)
-            print(f"\n{'='*60}")
-            print(f"[LLM DEBUG] Starting translation")
-            print(f"  Model: {model_name}")
-            print(f"  Provider: {config.get('provider', 'unknown')}")
-            print(f"  Target language: {target_language}")
-            print(f"  Text length: {len(text)} chars")
+            logger.info(
+                "[LLM DEBUG] Starting translation\n  Model: %s\n  Provider: %s\n  Target language: %s\n"
+                "  Text length: %s chars",
+                model_name, config.get('provider', 'unknown'), target_language, len(text)
+            )
             
             # Use unified adapter interface
             translated, usage = adapter.generate(prompt)
@@ -1167,18 +1179,13 @@ CHECK 3 -- Valuation & P&L Context:
             elapsed_time = time.time() - start_time
             
             # Print success log
-            print(f"[LLM DEBUG] ✅ Translation completed successfully")
-            print(f"  Total time: {elapsed_time:.2f}s")
-            print(f"  Output length: {len(translated)} chars")
-            if usage:
-                print(f"  Token usage: input={usage.get('input_tokens', 'N/A')}, output={usage.get('output_tokens', 'N/A')}")
-            print(f"{'='*60}\n")
+            logger.info(
+                "[LLM DEBUG] ✅ Translation completed successfully\n  Total time: %.2fs\n  Output length: %s chars%s",
+                elapsed_time, len(translated), _format_usage(usage, "\n  Token usage: input=%s, output=%s")
+            )
             
             return {"translation": translated}
         except Exception as e:
             elapsed_time = time.time() - start_time if 'start_time' in locals() else 0
-            print(f"[LLM DEBUG] ❌ Translation failed")
-            print(f"  Total time: {elapsed_time:.2f}s")
-            print(f"  Error: {str(e)}")
-            print(f"{'='*60}\n")
+            logger.error("[LLM DEBUG] ❌ Translation failed\n  Total time: %.2fs\n  Error: %s", elapsed_time, e)
             return {"error": str(e)}
@@ -8,6 +8,7 @@ from typing import List, Dict, Optional, Tuple
 import threading
 import time
 from functools import wraps
+from concurrent.futures import Future
 
 
 class RateLimiter:
@@ -565,19 +566,53 @@ class DataProvider:
             
             # Get the latest close price (last row)
             latest_price = float(hist['Close'].iloc[-1])
-            
-            # Round to appropriate precision based on price magnitude
-            if latest_price >= 100:
-                return round(latest_price, 2)
-            elif latest_price >= 10:
-                return round(latest_price, 3)
-            else:
-                return round(latest_price, 4)
+            return DataProvider._round_price(latest_price)
                 
         except Exception as e:
             print(f"Error fetching current price for {symbol}: {e}")
             return None
     
+    @staticmethod
+    def get_current_prices(symbols, chunk_size=50):
+        """
+        Get the latest prices for several symbols with batched yfinance downloads
+        (one request per chunk of symbols).
+        Returns {symbol: price}; symbols without data are omitted so callers can
+        fall back to get_current_price.
+        """
+        prices = {}
+        for i in range(0, len(symbols), chunk_size):
+            chunk = symbols[i:i + chunk_size]
+            try:
+                data = yf.download(chunk, period="1d", auto_adjust=True, group_by='ticker', progress=False)
+            except Exception as e:
+                print(f"Error batch fetching current prices for {chunk}: {e}")
+                continue
+            if data is None or data.empty:
+                continue
+            
+            for symbol in chunk:
+                if isinstance(data.columns, pd.MultiIndex):
+                    if symbol not in data.columns.get_level_values(0):
+                        continue
+                    close = data[symbol]['Close'].dropna()
+                else:
+                    # Single ticker downloads may come back with flat columns
+                    close = data['Close'].dropna()
+                if not close.empty:
+                    prices[symbol] = DataProvider._round_price(float(close.iloc[-1]))
+        return prices
+    
+    @staticmethod
+    def _round_price(price):
+        """Round to a precision appropriate for the price magnitude."""
+        if price >= 100:
+            return round(price, 2)
+        elif price >= 10:
+            return round(price, 3)
+        else:
+            return round(price, 4)
+    
     @staticmethod
     def get_daily_change_percent(symbol):
         """
@@ -740,6 +775,7 @@ class BatchFetcher:
                     cls._instance._cache = {}            # key -> data
                     cls._instance._cache_timestamps = {}  # key -> (timestamp, ttl_seconds)
                     cls._instance._cache_lock = threading.Lock()
+                    cls._instance._inflight = {}  # key -> Future of the fetch currently running for it
                     # Rate limiter: allow 5 requests per 1 second (yfinance is more lenient)
                     cls._instance._rate_limiter = RateLimiter(max_calls=5, time_window=1)
         return cls._instance
@@ -797,6 +833,32 @@ class BatchFetcher:
                 self._cache_timestamps.pop(cache_key, None)
         return None
     
+    def _single_flight(self, cache_key, fetch):
+        """
+        Run fetch() at most once per key at a time: concurrent callers missing
+        the cache for the same key wait for the in-flight result instead of
+        issuing their own request.
+        """
+        with self._cache_lock:
+            future = self._inflight.get(cache_key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._inflight[cache_key] = future
+        if not is_owner:
+            return future.result()
+        
+        try:
+            result = fetch()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._cache_lock:
+                self._inflight.pop(cache_key, None)
+    
     @retry_on_rate_limit(max_retries=3, initial_delay=2.0, backoff_factor=2.0)
     def batch_fetch_history(
         self,
@@ -942,16 +1004,36 @@ class BatchFetcher:
         if cached:
             return cached
         
-        # Acquire rate limit permission
-        self._rate_limiter.acquire()
+        def fetch():
+            # Acquire rate limit permission
+            self._rate_limiter.acquire()
+            result = DataProvider.get_kline_data(symbol, period, interval, is_cn_fund=is_cn_fund)
+            # Update cache with appropriate TTL
+            if result:
+                self._update_cache(cache_key, result, ttl_seconds=ttl)
+            return result
         
-        # Fetch data
-        result = DataProvider.get_kline_data(symbol, period, interval, is_cn_fund=is_cn_fund)
+        return self._single_flight(cache_key, fetch)
+    
+    def get_cached_symbol_name(self, symbol: str, asset_type: str = 'STOCK', currency: str = 'USD') -> Optional[str]:
+        """
+        Get the full name of a symbol with caching support (names rarely change, 1 day TTL).
         
-        # Update cache with appropriate TTL
-        if result:
-            self._update_cache(cache_key, result, ttl_seconds=ttl)
-        return result
+        Returns:
+            String name or None if not found
+        """
+        cache_key = f"name_{symbol}_{asset_type}_{currency}"
+        cached = self._get_from_cache(cache_key)
+        if cached is not None:
+            return cached or None  # '' marks a cached miss
+        
+        def fetch():
+            name = DataProvider.get_symbol_name(symbol, asset_type=asset_type, currency=currency)
+            # A miss may just be a transient lookup failure, so it is only cached briefly (5 minutes)
+            self._update_cache(cache_key, name or '', ttl_seconds=86400 if name else 300)
+            return name
+        
+        return self._single_flight(cache_key, fetch)
     
     @retry_on_rate_limit(max_retries=3, initial_delay=10.0, backoff_factor=2.0)
     def get_cached_current_price(self, symbol: str, asset_type: str = None, currency: str = None) -> Optional[float]:
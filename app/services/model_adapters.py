@@ -7,11 +7,30 @@ import os
 import time
 import json
 import re
+import threading
 from abc import ABC, abstractmethod
+from app.utils.log_queue import format_fields, get_logger
+
+logger = get_logger(__name__)
 
 # Default maximum number of tool call iterations to prevent infinite loops
 DEFAULT_MAX_TOOL_ITERATIONS = 10
 
+# SDK clients shared by every adapter in the process, keyed by (provider, api_key).
+# Each client owns an HTTP connection pool, so sharing it keeps TLS connections alive across tasks and models.
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(provider, api_key, factory):
+    """Return the process-wide SDK client for (provider, api_key), creating it with factory() on first use."""
+    key = (provider, api_key)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = _shared_clients[key] = factory()
+        return client
+
 
 def _accumulate_usage(total_usage, new_usage):
     """Helper to accumulate token usage from multiple API calls"""
@@ -56,29 +75,20 @@ class BaseModelAdapter(ABC):
     
     def _log_start(self, operation, **params):
         """Log operation start"""
-        print(f"\n{'='*60}")
-        print(f"[LLM DEBUG] Starting {operation}")
-        for key, value in params.items():
-            print(f"  {key}: {value}")
+        logger.info("[LLM DEBUG] Starting %s%s", operation, format_fields(params))
         return time.time()
     
     def _log_success(self, start_time, **metrics):
         """Log successful completion"""
         elapsed = time.time() - start_time
-        print(f"[LLM DEBUG] ✅ Operation completed successfully")
-        print(f"  Total time: {elapsed:.2f}s")
-        for key, value in metrics.items():
-            print(f"  {key}: {value}")
-        print(f"{'='*60}\n")
+        logger.info("[LLM DEBUG] ✅ Operation completed successfully\n  Total time: %.2fs%s",
+                    elapsed, format_fields(metrics))
         return elapsed
     
     def _log_error(self, start_time, error):
         """Log error"""
         elapsed = time.time() - start_time
-        print(f"[LLM DEBUG] ❌ Operation failed")
-        print(f"  Total time: {elapsed:.2f}s")
-        print(f"  Error: {str(error)}")
-        print(f"{'='*60}\n")
+        logger.error("[LLM DEBUG] ❌ Operation failed\n  Total time: %.2fs\n  Error: %s", elapsed, error)
 
     def _openai_compatible_tool_loop(self, messages, tools, tool_executor,
                                      total_usage, extra_params=None,
@@ -142,8 +152,8 @@ class BaseModelAdapter(ABC):
                 except Exception:
                     tool_args = {}
 
-                print(f"  [Agent] 🔧 Tool call #{len(tool_executor.tool_calls)+1}: "
-                      f"{tool_name}({json.dumps(tool_args, ensure_ascii=False)[:100]})")
+                logger.info("  [Agent] 🔧 Tool call #%s: %s(%s)", len(tool_executor.tool_calls) + 1,
+                            tool_name, json.dumps(tool_args, ensure_ascii=False)[:100])
 
                 result_str = tool_executor.execute(tool_name, tool_args)
                 messages.append({
@@ -172,9 +182,9 @@ class GeminiAdapter(BaseModelAdapter):
         if self.api_key:
             try:
                 from google import genai
-                self.client = genai.Client(api_key=self.api_key)
+                self.client = get_shared_client('gemini', self.api_key, lambda: genai.Client(api_key=self.api_key))
             except Exception as e:
-                print(f"Failed to init Gemini client: {e}")
+                logger.warning("Failed to init Gemini client: %s", e)
                 self.client = None
     
     def is_available(self):
@@ -264,7 +274,8 @@ class GeminiAdapter(BaseModelAdapter):
                     tool_name = fc.name
                     tool_args = dict(fc.args) if fc.args else {}
                     
-                    print(f"  [Agent] 🔧 Tool call #{len(tool_executor.tool_calls)+1}: {tool_name}({json.dumps(tool_args, ensure_ascii=False)[:100]})")
+                    logger.info("  [Agent] 🔧 Tool call #%s: %s(%s)", len(tool_executor.tool_calls) + 1,
+                                tool_name, json.dumps(tool_args, ensure_ascii=False)[:100])
                     
                     # Execute the tool
                     result_str = tool_executor.execute(tool_name, tool_args)
@@ -310,9 +321,9 @@ class OpenAIAdapter(BaseModelAdapter):
         if self.api_key:
             try:
                 from openai import OpenAI
-                self.client = OpenAI(api_key=self.api_key)
+                self.client = get_shared_client('openai', self.api_key, lambda: OpenAI(api_key=self.api_key))
             except Exception as e:
-                print(f"Failed to init OpenAI client: {e}")
+                logger.warning("Failed to init OpenAI client: %s", e)
                 self.client = None
     
     def is_available(self):
@@ -368,9 +379,9 @@ class AnthropicAdapter(BaseModelAdapter):
         if self.api_key:
             try:
                 from anthropic import Anthropic
-                self.client = Anthropic(api_key=self.api_key)
+                self.client = get_shared_client('anthropic', self.api_key, lambda: Anthropic(api_key=self.api_key))
             except Exception as e:
-                print(f"Failed to init Anthropic client: {e}")
+                logger.warning("Failed to init Anthropic client: %s", e)
                 self.client = None
     
     def is_available(self):
@@ -432,7 +443,8 @@ class AnthropicAdapter(BaseModelAdapter):
                     tool_args = block.input or {}
                     tool_use_id = block.id
                     
-                    print(f"  [Agent] 🔧 Tool call #{len(tool_executor.tool_calls)+1}: {tool_name}({json.dumps(tool_args, ensure_ascii=False)[:100]})")
+                    logger.info("  [Agent] 🔧 Tool call #%s: %s(%s)", len(tool_executor.tool_calls) + 1,
+                                tool_name, json.dumps(tool_args, ensure_ascii=False)[:100])
                     
                     result_str = tool_executor.execute(tool_name, tool_args)
                     
@@ -480,12 +492,12 @@ class QwenAdapter(BaseModelAdapter):
             try:
                 from openai import OpenAI
                 # Qwen uses OpenAI-compatible API
-                self.client = OpenAI(
+                self.client = get_shared_client('qwen', self.api_key, lambda: OpenAI(
                     api_key=self.api_key,
                     base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-                )
+                ))
             except Exception as e:
-                print(f"Failed to init Qwen client: {e}")
+                logger.warning("Failed to init Qwen client: %s", e)
                 self.client = None
     
     def is_available(self):
@@ -1,28 +1,112 @@
+import os
+import gzip
 import threading
 import uuid
-import json
-from datetime import datetime
-from app import db
-from app.models.analysis import Task
+import hashlib
+import time
+from collections import defaultdict
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from datetime import datetime, date
+from types import MappingProxyType
+from sqlalchemy import select, update
+from sqlalchemy.orm import defer
+from flask import current_app
+from app import db, create_app
+from app.models.analysis import Task, Portfolio, Transaction
 from app.services.ai_analyzer import AIAnalyzer
-from app.services.data_provider import DataProvider
+from app.services.agent_tools import AgentCancelled
+from app.services.data_provider import batch_fetcher
+from app.utils.quant_math import fifo_match_lots
+from app.utils import json_codec
+from app.utils.log_queue import get_logger
+
+logger = get_logger(__name__)
+
+# 后台任务工作线程数（同时执行的任务上限，其余任务排队等待）
+# 任务几乎全部时间在等待 AI / 行情接口的网络 I/O（期间释放 GIL），因此线程数可以明显多于 CPU 核数
+TASK_WORKER_COUNT = int(os.environ.get('TASK_WORKERS', 8))
+
+# 压缩后仍超过该大小（字符数）的任务结果写入 TASK_RESULTS_DIR 下的压缩文件，tasks 表只保存引用
+TASK_RESULT_INLINE_MAX = 64 * 1024
+RESULT_FILE_KEY = '$result_file'
+
+# AI 分析结果缓存时长（秒）：同一交易日内持仓未变化的重复分析直接返回缓存
+AI_ANALYSIS_CACHE_TTL = 6 * 3600
+
+# 任务参数默认值（只读，所有任务共享）
+TASK_PARAM_DEFAULTS = MappingProxyType({
+    'model': 'gemini-3-flash-preview',
+    'language': 'zh',
+})
+
+RECOMMENDATION_CRITERIA_DEFAULTS = MappingProxyType({
+    'market': 'Any',
+    'asset_type': 'STOCK',
+    'include_etf': 'false',
+    'capital': 'Any',
+    'risk': 'Any',
+    'frequency': 'Any',
+})
+
+class TaskHandle:
+    """进程内登记的排队/运行中任务（任务主键、停止标志、线程池 Future、所在工作线程、开始执行时间）"""
+    __slots__ = ('task_pk', 'stop_flag', 'future', 'worker', 'started_at')
+    
+    def __init__(self, task_pk, stop_flag):
+        self.task_pk = task_pk
+        self.stop_flag = stop_flag
+        self.future = None
+        self.worker = None  # None while still queued
+        self.started_at = None
 
 class TaskService:
     """异步任务服务"""
     
     def __init__(self):
         self.ai_analyzer = AIAnalyzer()
-        self._running_tasks = {}  # {task_id: thread}
-        self._task_stop_flags = {}  # {task_id: stop_flag}
+        # 任务类型 -> 处理函数，统一签名 handler(params, stop_flag, user_id)
+        self._handlers = {
+            'kline_analysis': self._execute_kline_analysis,
+            'portfolio_diagnosis': self._execute_portfolio_diagnosis,
+            'stock_recommendation': self._execute_stock_recommendation,
+        }
+        self._handles = {}  # {task_id: TaskHandle}
+        self._handles_lock = threading.Lock()
+        # 固定大小的线程池：线程复用，超出的任务在池内排队
+        self._executor = ThreadPoolExecutor(max_workers=TASK_WORKER_COUNT, thread_name_prefix='task')
         self._app = None  # Reusable app reference to avoid repeated create_app()
+        self._app_lock = threading.Lock()
     
     def _get_app(self):
-        """Get or create Flask app instance for background tasks (reuse to save memory)."""
+        """Get the Flask app for background tasks: the one that created them, or a lazily created one."""
         if self._app is None:
-            from app import create_app
-            self._app = create_app()
+            with self._app_lock:
+                # 双重检查：多个工作线程同时启动时只构建一次 app
+                if self._app is None:
+                    self._app = create_app()
         return self._app
     
+    def _run_task(self, task_id, task_type, task_params, user_id, handle):
+        """Pool entry point: skip tasks terminated while queued, record the worker, then execute."""
+        try:
+            if handle.stop_flag.is_set():
+                # 排队期间已被终止，直接丢弃
+                self._release_handle(task_id)
+                return
+            # handle 由提交方直接传入，只由本线程写入，无需加锁查表
+            handle.worker = threading.current_thread().name
+            handle.started_at = time.time()
+            self._execute_task(handle.task_pk, task_id, task_type, task_params, user_id, handle.stop_flag)
+        except Exception as e:
+            logger.error("Task worker %s error on %s: %s", threading.current_thread().name, task_id, e)
+    
+    def _release_handle(self, task_id):
+        """Drop a task's handle; returns it (or None if already released)."""
+        with self._handles_lock:
+            return self._handles.pop(task_id, None)
+    
     def create_task(self, user_id, task_type, task_params):
         """创建新任务"""
         task_id = str(uuid.uuid4())
@@ -33,71 +117,61 @@ class TaskService:
             user_id=user_id,
             task_type=task_type,
             status='running',
-            task_params=json.dumps(task_params),
+            task_params=task_params,
             started_at=datetime.utcnow()
         )
         
         db.session.add(task)
         db.session.commit()
         
-        # 创建停止标志
-        stop_flag = threading.Event()
-        self._task_stop_flags[task_id] = stop_flag
+        # 复用当前请求所在的 app，工作线程无需再 create_app()
+        if self._app is None:
+            self._app = current_app._get_current_object()
+        
+        # 创建停止标志并登记任务（登记表只在登记/释放时加锁，执行过程中直接使用 handle）
+        handle = TaskHandle(task.id, threading.Event())
+        with self._handles_lock:
+            self._handles[task_id] = handle
         
-        # 启动后台任务
-        thread = threading.Thread(
-            target=self._execute_task,
-            args=(task_id, task_type, task_params, stop_flag),
-            daemon=True
+        # 提交到线程池执行；handle 携带主键，后台线程无需再查询任务记录
+        handle.future = self._executor.submit(
+            self._run_task, task_id, task_type, task_params, user_id, handle
         )
-        thread.start()
-        self._running_tasks[task_id] = thread
         
         return task_id
     
-    def _execute_task(self, task_id, task_type, task_params, stop_flag):
+    def _execute_task(self, task_pk, task_id, task_type, task_params, user_id, stop_flag):
         """执行任务（后台线程）"""
         app = self._get_app()
         with app.app_context():
+            # 后台线程的 session 随 app context 创建/销毁，提交后无需过期重载 task 属性
+            db.session().expire_on_commit = False
             try:
-                task = Task.query.filter_by(task_id=task_id).first()
-                if not task:
-                    return
-                
-                if task_type == 'kline_analysis':
-                    result = self._execute_kline_analysis(task_params, stop_flag, task.user_id)
-                elif task_type == 'portfolio_diagnosis':
-                    result = self._execute_portfolio_diagnosis(task_params, stop_flag)
-                elif task_type == 'stock_recommendation':
-                    result = self._execute_stock_recommendation(task_params, stop_flag)
-                else:
+                handler = self._handlers.get(task_type)
+                if handler is None:
                     raise ValueError(f"Unknown task type: {task_type}")
+                try:
+                    result = handler(task_params, stop_flag, user_id)
+                except AgentCancelled:
+                    # 任务被终止，Agent 在下一次工具调用前中断（terminated 状态已由 terminate_task 写入）
+                    logger.info("Task %s stopped during agent run", task_id)
+                    return
                 
-                # 检查是否被终止
+                # 检查是否被终止（terminate_task 已写入 terminated 状态，无需再提交）
                 if stop_flag.is_set():
-                    task.status = 'terminated'
-                    task.completed_at = datetime.utcnow()
-                    db.session.commit()
                     return
                 
-                # 保存结果
-                task.status = 'completed'
-                result_json = json.dumps(result)
-                task.task_result = result_json
-                task.completed_at = datetime.utcnow()
+                # 保存结果：状态、结果、完成时间一条 UPDATE 写入
                 try:
-                    db.session.commit()
+                    self._finish_task(task_pk, status='completed', task_result=self._store_result(task_id, result))
                 except Exception as commit_error:
                     # 如果提交失败（可能是数据太大），回滚并标记为失败
                     db.session.rollback()
-                    task.status = 'failed'
-                    error_msg = f"Failed to save result: {str(commit_error)}"
-                    if len(error_msg) > 65535:
-                        error_msg = error_msg[:65500] + "... (truncated)"
-                    task.error_message = error_msg
-                    task.completed_at = datetime.utcnow()
-                    db.session.commit()
-                    print(f"Task {task_id} failed to save result: {commit_error}")
+                    self._finish_task(
+                        task_pk, status='failed',
+                        error_message=self._truncate_error(f"Failed to save result: {str(commit_error)}")
+                    )
+                    logger.error("Task %s failed to save result: %s", task_id, commit_error)
                     return
                 
             except Exception as e:
@@ -105,157 +179,268 @@ class TaskService:
                 # 先回滚之前的错误事务
                 db.session.rollback()
                 try:
-                    task = Task.query.filter_by(task_id=task_id).first()
-                    if task:
-                        task.status = 'failed'
-                        # 截断错误信息，避免过长
-                        error_msg = str(e)
-                        if len(error_msg) > 65535:  # TEXT 字段最大长度
-                            error_msg = error_msg[:65500] + "... (truncated)"
-                        task.error_message = error_msg
-                        task.completed_at = datetime.utcnow()
-                        db.session.commit()
+                    self._finish_task(task_pk, status='failed', error_message=self._truncate_error(str(e)))
                 except Exception as save_error:
                     db.session.rollback()
-                    print(f"Failed to save error for task {task_id}: {save_error}")
-                print(f"Task {task_id} failed: {e}")
+                    logger.error("Failed to save error for task %s: %s", task_id, save_error)
+                logger.error("Task %s failed: %s", task_id, e)
             finally:
                 # 清理
-                self._running_tasks.pop(task_id, None)
-                self._task_stop_flags.pop(task_id, None)
+                self._release_handle(task_id)
+    
+    @staticmethod
+    def _store_result(task_id, result):
+        """Serialize a task result for the tasks table; large results go to a gzip file and only a reference is stored."""
+        text = json_codec.dumps(result)
+        # 中等大小的结果压缩后仍存入 tasks 表（K 线 JSON 重复度高，通常能压到 1/5 以下）
+        stored = json_codec.compress_text(text)
+        if len(stored) <= TASK_RESULT_INLINE_MAX:
+            return stored
+        
+        results_dir = current_app.config['TASK_RESULTS_DIR']
+        os.makedirs(results_dir, exist_ok=True)
+        filename = f"{task_id}.json.gz"
+        tmp_path = os.path.join(results_dir, filename + '.tmp')
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+            f.write(text.encode('utf-8'))
+        os.replace(tmp_path, os.path.join(results_dir, filename))
+        return json_codec.dumps({RESULT_FILE_KEY: filename, 'size': len(text)})
+    
+    @staticmethod
+    def _resolve_result(task_dict):
+        """Replace a stored result-file reference in task_dict with the actual result."""
+        result = task_dict.get('task_result')
+        if isinstance(result, dict) and RESULT_FILE_KEY in result:
+            path = os.path.join(current_app.config['TASK_RESULTS_DIR'], os.path.basename(result[RESULT_FILE_KEY]))
+            try:
+                with gzip.open(path, 'rb') as f:
+                    task_dict['task_result'] = json_codec.loads(f.read())
+            except (OSError, ValueError) as e:
+                logger.warning("Failed to load result file for task %s: %s", task_dict.get('task_id'), e)
+                task_dict['task_result'] = None
+        return task_dict
+    
+    @staticmethod
+    def _truncate_error(error_msg):
+        """截断错误信息，避免超过 TEXT 字段最大长度"""
+        if len(error_msg) > 65535:
+            error_msg = error_msg[:65500] + "... (truncated)"
+        return error_msg
+    
+    @staticmethod
+    def _finish_task(task_pk, **values):
+        """Write a task's terminal state with a single UPDATE by primary key + commit (no SELECT).
+        
+        Only a still-running task is updated, so a concurrent terminate_task is never overwritten.
+        """
+        db.session.execute(
+            update(Task).where(
+                Task.id == task_pk, Task.status == 'running'
+            ).values(completed_at=datetime.utcnow(), **values)
+        )
+        db.session.commit()
+    
+    def _load_user_transactions(self, user_id, symbol):
+        """Load the user's transactions for symbol in their own app context (runs on a helper thread).
+        
+        Returns lightweight rows (attribute access like the ORM objects).
+        """
+        with self._get_app().app_context():
+            # 持仓与交易记录一次查询取回：portfolio_id 用标量子查询在服务端解析
+            portfolio_id = db.session.query(Portfolio.id).filter_by(
+                user_id=user_id, symbol=symbol
+            ).limit(1).scalar_subquery()
+            # 只取用到的列，避免长交易历史构建完整 ORM 对象；结果需在 app context 结束前取完
+            stmt = select(
+                Transaction.transaction_type, Transaction.trade_date,
+                Transaction.price, Transaction.quantity, Transaction.notes
+            ).where(
+                Transaction.portfolio_id == portfolio_id
+            ).order_by(Transaction.trade_date.asc())
+            return list(db.session.execute(stmt))
+    
+    @staticmethod
+    def _analysis_cache_key(symbol, asset_type, model_name, language, user_id):
+        """Cache key for an agent analysis: same symbol/model/language, same day, same portfolio state."""
+        position = ''
+        if user_id:
+            # Agent 会通过工具读取用户全部持仓；任何交易都会更新 portfolio.updated_at
+            count, last_update = db.session.query(
+                db.func.count(Portfolio.id), db.func.max(Portfolio.updated_at)
+            ).filter(Portfolio.user_id == user_id).one()
+            position = f"{user_id}:{count}:{last_update.isoformat() if last_update else ''}"
+        raw = '|'.join([symbol, asset_type, model_name, language, date.today().isoformat(), position])
+        return 'ai_analysis:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _get_cached_analysis(cache_key):
+        """Return a cached agent analysis result, or None."""
+        from app import r  # r is rebound in create_app(), so it cannot be imported at module load
+        try:
+            cached = r.get(cache_key)
+            if cached:
+                if isinstance(cached, bytes):
+                    cached = cached.decode('utf-8')
+                return json_codec.loads_compressed(cached)
+        except Exception as e:
+            logger.warning("Failed to read cached analysis: %s", e)
+        return None
+    
+    @staticmethod
+    def _cache_analysis(cache_key, analysis_result):
+        """Store an agent analysis result for AI_ANALYSIS_CACHE_TTL seconds."""
+        from app import r
+        try:
+            r.setex(cache_key, AI_ANALYSIS_CACHE_TTL, json_codec.dumps_compressed(analysis_result))
+        except Exception as e:
+            logger.warning("Failed to cache analysis: %s", e)
     
     def _execute_kline_analysis(self, params, stop_flag, user_id=None):
         """执行K线分析任务（Agent 模式，AI 自行拉取所需数据）"""
-        from app.models.analysis import Portfolio, Transaction, AnalysisLog
-        from datetime import datetime
-        
+        params = {**TASK_PARAM_DEFAULTS, **params}
         symbol = params.get('symbol')
         asset_type = params.get('asset_type', 'STOCK')
         is_cn_fund = params.get('is_cn_fund', False)
-        model_name = params.get('model', 'gemini-3-flash-preview')
-        language = params.get('language', 'zh')
+        model_name = params['model']
+        language = params['language']
         
         # 获取资产名称（特别是基金名称，用于 prompt 中的标识）
         symbol_name = None
         if is_cn_fund or asset_type == 'FUND_CN':
-            symbol_name = DataProvider.get_symbol_name(symbol, asset_type='FUND_CN')
+            symbol_name = batch_fetcher.get_cached_symbol_name(symbol, asset_type='FUND_CN')
             if symbol_name:
-                print(f"📝 Found fund name: {symbol_name} for {symbol}")
+                logger.info("📝 Found fund name: %s for %s", symbol_name, symbol)
         
         if stop_flag.is_set():
             return None
         
-        # Agent mode: AI will fetch kline, portfolio, and position data via tool calls
-        print(f"🤖 [Agent Mode] Using agent mode for {symbol} with {model_name}")
-        analysis_result = self.ai_analyzer.analyze_with_agent(
-            symbol,
-            model_name=model_name,
-            language=language,
-            asset_type=asset_type,
-            symbol_name=symbol_name,
-            user_id=user_id
-        )
+        # K 线（仅供前端绘图）与用户交易记录都与 AI 分析无关，在辅助线程中并行获取
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # Fetch kline data for frontend chart rendering (AI already fetched its own via tools)
+            kline_future = executor.submit(
+                batch_fetcher.get_cached_kline_data,
+                symbol, period="3y", interval="1d",
+                is_cn_fund=(asset_type == 'FUND_CN')
+            )
+            tx_future = executor.submit(self._load_user_transactions, user_id, symbol) if user_id else None
+            
+            # 同一交易日、同一持仓状态下的重复分析直接复用缓存结果
+            cache_key = self._analysis_cache_key(symbol, asset_type, model_name, language, user_id)
+            analysis_result = self._get_cached_analysis(cache_key)
+            if analysis_result is not None:
+                logger.info("⚡ Using cached analysis for %s with %s", symbol, model_name)
+            else:
+                # Agent mode: AI will fetch kline, portfolio, and position data via tool calls
+                logger.info("🤖 [Agent Mode] Using agent mode for %s with %s", symbol, model_name)
+                analysis_result = self.ai_analyzer.analyze_with_agent(
+                    symbol,
+                    model_name=model_name,
+                    language=language,
+                    asset_type=asset_type,
+                    symbol_name=symbol_name,
+                    user_id=user_id,
+                    stop_event=stop_flag
+                )
+                if not analysis_result.get('is_fallback'):
+                    self._cache_analysis(cache_key, analysis_result)
+            
+            kline_data = kline_future.result() or []
+            real_transactions = tx_future.result() if tx_future else []
         
-        # Fetch kline data for frontend chart rendering (AI already fetched its own via tools)
-        from app.services.data_provider import batch_fetcher
-        kline_data = batch_fetcher.get_cached_kline_data(
-            symbol, period="3y", interval="1d",
-            is_cn_fund=(asset_type == 'FUND_CN')
-        )
-        if not kline_data:
-            kline_data = []
+        # 内容指纹：客户端已持有相同 K 线时，任务查询接口可省略 kline_data
+        kline_hash = hashlib.blake2b(
+            json_codec.dumps(kline_data).encode('utf-8'), digest_size=16
+        ).hexdigest()
         
         # Build user transaction history for frontend display
         reconstructed_trades = []
         user_transactions = []
-        if user_id:
-            real_portfolio = Portfolio.query.filter_by(user_id=user_id, symbol=symbol).first()
-            if real_portfolio:
-                real_transactions = Transaction.query.filter_by(
-                    portfolio_id=real_portfolio.id
-                ).order_by(Transaction.trade_date.asc()).all()
-                
-                buy_queue = []
-                for t in real_transactions:
-                    date_str = t.trade_date.strftime('%Y-%m-%d')
-                    user_transactions.append({
-                        "type": t.transaction_type,
-                        "date": date_str,
-                        "price": float(t.price),
-                        "reason": t.notes or 'Manual Trade'
-                    })
-                    
-                    if t.transaction_type == 'BUY':
-                        buy_queue.append({
-                            'date': date_str,
-                            'price': float(t.price),
-                            'quantity': float(t.quantity),
-                            'reason': t.notes or 'Manual Buy'
-                        })
-                    elif t.transaction_type == 'SELL':
-                        sell_qty = float(t.quantity)
-                        while sell_qty > 0 and buy_queue:
-                            buy_record = buy_queue[0]
-                            matched_qty = min(sell_qty, buy_record['quantity'])
-                            buy_price = buy_record['price']
-                            sell_price = float(t.price)
-                            ret_pct = ((sell_price - buy_price) / buy_price) * 100
-                            d1 = datetime.strptime(buy_record['date'], '%Y-%m-%d')
-                            d2 = t.trade_date
-                            days = (datetime.combine(d2, datetime.min.time()) - d1).days
-                            reconstructed_trades.append({
-                                "buy_date": buy_record['date'],
-                                "buy_price": buy_price,
-                                "sell_date": date_str,
-                                "sell_price": sell_price,
-                                "status": "CLOSED",
-                                "holding_period": f"{days} days",
-                                "return_rate": f"{ret_pct:+.2f}%",
-                                "reason": buy_record['reason'],
-                                "sell_reason": t.notes or 'Manual Sell'
-                            })
-                            sell_qty -= matched_qty
-                            buy_record['quantity'] -= matched_qty
-                            if buy_record['quantity'] <= 0.000001:
-                                buy_queue.pop(0)
-                
-                # Process open positions
-                if kline_data:
-                    latest_close = kline_data[-1]['close']
-                    latest_date_str = kline_data[-1]['date']
-                    for b in buy_queue:
-                        buy_price = b['price']
-                        curr_ret = ((latest_close - buy_price) / buy_price) * 100
-                        d1 = datetime.strptime(b['date'], '%Y-%m-%d')
-                        d2 = datetime.strptime(latest_date_str, '%Y-%m-%d')
-                        days = (d2 - d1).days
-                        reconstructed_trades.append({
-                            "buy_date": b['date'],
-                            "buy_price": b['price'],
-                            "sell_date": None,
-                            "sell_price": None,
-                            "status": "HOLDING",
-                            "holding_period": f"{days} days",
-                            "return_rate": f"{curr_ret:+.2f}% (Open)",
-                            "reason": b['reason']
-                        })
-                
-                reconstructed_trades.sort(key=lambda x: x['buy_date'], reverse=True)
+        tx_prices_by_key = defaultdict(list)  # {(type, date): [price, ...]}，用于标记被采纳的 AI 信号
+        if real_transactions:
+            # 单次遍历：同时生成前端交易列表、采纳匹配索引，以及 FIFO 所需的买卖分组
+            buys, sells = [], []
+            buy_dates, sell_dates = [], []  # 与 buys/sells 对应的日期字符串，只格式化一次
+            lot_quantities, lot_is_buy = [], []
+            for t in real_transactions:
+                date_str = t.trade_date.isoformat()
+                price = float(t.price)
+                user_transactions.append({
+                    "type": t.transaction_type,
+                    "date": date_str,
+                    "price": price,
+                    "reason": t.notes or 'Manual Trade'
+                })
+                tx_prices_by_key[(t.transaction_type, date_str)].append(price)
+                if t.transaction_type == 'BUY':
+                    buys.append(t)
+                    buy_dates.append(date_str)
+                elif t.transaction_type == 'SELL':
+                    sells.append(t)
+                    sell_dates.append(date_str)
+                else:
+                    continue
+                lot_quantities.append(float(t.quantity))
+                lot_is_buy.append(t.transaction_type == 'BUY')
+            
+            # FIFO match sells against buy lots (vectorized, see fifo_match_lots)
+            buy_pos, sell_pos, open_pos = fifo_match_lots(lot_quantities, lot_is_buy)
+            
+            buy_prices = np.array([float(t.price) for t in buys])
+            sell_prices = np.array([float(t.price) for t in sells])
+            matched_buy_prices = buy_prices[buy_pos]
+            matched_sell_prices = sell_prices[sell_pos]
+            returns = (matched_sell_prices - matched_buy_prices) / matched_buy_prices * 100
+            
+            closed_trades = [{
+                "buy_date": buy_dates[b],
+                "buy_price": buy_price,
+                "sell_date": sell_dates[s],
+                "sell_price": sell_price,
+                "status": "CLOSED",
+                "holding_period": f"{(sells[s].trade_date - buys[b].trade_date).days} days",
+                "return_rate": f"{ret_pct:+.2f}%",
+                "reason": buys[b].notes or 'Manual Buy',
+                "sell_reason": sells[s].notes or 'Manual Sell'
+            } for b, s, buy_price, sell_price, ret_pct in zip(
+                buy_pos.tolist(), sell_pos.tolist(),
+                matched_buy_prices.tolist(), matched_sell_prices.tolist(), returns.tolist()
+            )]
+            
+            # Process open positions (buy lots with quantity still open)
+            open_trades = []
+            if kline_data:
+                latest_close = kline_data[-1]['close']
+                latest_date = date.fromisoformat(kline_data[-1]['date'])
+                open_trades = [{
+                    "buy_date": buy_dates[b],
+                    "buy_price": buy_price,
+                    "sell_date": None,
+                    "sell_price": None,
+                    "status": "HOLDING",
+                    "holding_period": f"{(latest_date - buys[b].trade_date).days} days",
+                    "return_rate": f"{(latest_close - buy_price) / buy_price * 100:+.2f}% (Open)",
+                    "reason": buys[b].notes or 'Manual Buy'
+                } for b, buy_price in zip(open_pos.tolist(), buy_prices[open_pos].tolist())]
+            
+            reconstructed_trades = sorted(
+                closed_trades + open_trades, key=itemgetter('buy_date'), reverse=True
+            )
         
-        # Mark AI signals adopted by user
+        # Mark AI signals adopted by user（匿名分析没有交易记录，直接全部标记为未采纳）
         ai_signals = analysis_result.get('signals', [])
-        for signal in ai_signals:
-            signal['adopted'] = False
-            for user_trans in user_transactions:
-                if (signal.get('type') == user_trans['type'] and
-                        signal.get('date') == user_trans['date']):
+        if tx_prices_by_key:
+            for signal in ai_signals:
+                signal['adopted'] = False
+                for tx_price in tx_prices_by_key.get((signal.get('type'), signal.get('date')), ()):
                     try:
-                        price_diff = abs(signal['price'] - user_trans['price']) / user_trans['price']
-                        if price_diff < 0.05:
+                        if abs(signal['price'] - tx_price) / tx_price < 0.05:
                             signal['adopted'] = True
                             break
                     except (TypeError, ZeroDivisionError):
                         pass
+        else:
+            for signal in ai_signals:
+                signal['adopted'] = False
         
         final_result = {
             "analysis_summary": analysis_result.get('analysis_summary', ''),
@@ -277,16 +462,18 @@ class TaskService:
             'symbol': symbol,
             'asset_type': asset_type,
             'kline_data': kline_data,
+            'kline_hash': kline_hash,
             'analysis': final_result,
             'source': 'user_real_data'
         }
-    def _execute_portfolio_diagnosis(self, params, stop_flag):
+    def _execute_portfolio_diagnosis(self, params, stop_flag, user_id=None):
         """执行持仓诊断任务（Agent 模式）"""
         if stop_flag.is_set():
             return None
         
-        model_name = params.get('model', 'gemini-3-flash-preview')
-        language = params.get('language', 'zh')
+        params = {**TASK_PARAM_DEFAULTS, **params}
+        model_name = params['model']
+        language = params['language']
 
         # Full portfolio analysis or single item
         portfolios = params.get('portfolios')
@@ -295,71 +482,72 @@ class TaskService:
                 portfolios, model_name=model_name, language=language
             )
         else:
-            print(f"🤖 [Agent Mode] Using agent mode for portfolio diagnosis with {model_name}")
+            logger.info("🤖 [Agent Mode] Using agent mode for portfolio diagnosis with %s", model_name)
             result = self.ai_analyzer.analyze_portfolio_item_with_agent(
                 params, model_name=model_name, language=language,
-                user_id=params.get('user_id')
+                user_id=params.get('user_id'), stop_event=stop_flag
             )
         
         return result
     
-    def _execute_stock_recommendation(self, params, stop_flag):
+    def _execute_stock_recommendation(self, params, stop_flag, user_id=None):
         """执行股票推荐任务（Agent 模式）"""
         if stop_flag.is_set():
             return None
         
-        model_name = params.get('model', 'gemini-3-flash-preview')
-        language = params.get('language', 'zh')
+        params = {**TASK_PARAM_DEFAULTS, **RECOMMENDATION_CRITERIA_DEFAULTS, **params}
+        model_name = params['model']
+        language = params['language']
 
-        criteria = {
-            'market': params.get('market', 'Any'),
-            'asset_type': params.get('asset_type', 'STOCK'),
-            'include_etf': params.get('include_etf', 'false'),
-            'capital': params.get('capital', 'Any'),
-            'risk': params.get('risk', 'Any'),
-            'frequency': params.get('frequency', 'Any')
-        }
+        criteria = {key: params[key] for key in RECOMMENDATION_CRITERIA_DEFAULTS}
 
-        print(f"🤖 [Agent Mode] Using agent mode for stock recommendation with {model_name}")
+        logger.info("🤖 [Agent Mode] Using agent mode for stock recommendation with %s", model_name)
         result = self.ai_analyzer.recommend_stocks_with_agent(
-            criteria, model_name=model_name, language=language
+            criteria, model_name=model_name, language=language, stop_event=stop_flag
         )
         
         return result
     
     def terminate_task(self, task_id, user_id):
         """终止任务"""
-        task = Task.query.filter_by(task_id=task_id, user_id=user_id).first()
-        if not task:
-            return False
+        # 本进程登记过的任务直接按主键定位，否则按 task_id 唯一索引（单次 dict 读取是原子的，无需加锁）
+        handle = self._handles.get(task_id)
+        key_clause = Task.id == handle.task_pk if handle else Task.task_id == task_id
         
-        if task.status != 'running':
+        # 条件 UPDATE：仅当任务属于该用户且仍在运行时生效，无需先查询
+        updated = db.session.execute(
+            update(Task).where(
+                key_clause,
+                Task.user_id == user_id,
+                Task.status == 'running'
+            ).values(status='terminated', completed_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if not updated:
             return False
         
         # 设置停止标志
-        stop_flag = self._task_stop_flags.get(task_id)
-        if stop_flag:
-            stop_flag.set()
-        
-        # 更新任务状态
-        task.status = 'terminated'
-        task.completed_at = datetime.utcnow()
-        db.session.commit()
+        handle = self._release_handle(task_id)
+        if handle:
+            handle.stop_flag.set()
+            # 仍在线程池中排队的任务直接取消，不再占用执行名额
+            if handle.future is not None:
+                handle.future.cancel()
         
         return True
     
     def get_task(self, task_id, user_id):
         """获取任务信息"""
         task = Task.query.filter_by(task_id=task_id, user_id=user_id).first()
-        return task.to_dict() if task else None
+        return self._resolve_result(task.to_dict()) if task else None
     
     def get_user_tasks(self, user_id, status=None):
-        """获取用户的所有任务"""
-        query = Task.query.filter_by(user_id=user_id)
+        """获取用户的所有任务（不含 task_result，结果通过 get_task 单独获取）"""
+        query = Task.query.options(defer(Task.task_result)).filter_by(user_id=user_id)
         if status:
             query = query.filter_by(status=status)
         tasks = query.order_by(Task.created_at.desc()).all()
-        return [task.to_dict() for task in tasks]
+        return [task.to_dict(include_result=False) for task in tasks]
 
 # 全局任务服务实例
 task_service = TaskService()
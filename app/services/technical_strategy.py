@@ -1,5 +1,7 @@
-import pandas as pd
-from datetime import datetime
+import numpy as np
+from app.utils.quant_math import rolling_mean, simulate_long_positions, wilder_rsi
+
+STOP_LOSS_PCT = 0.05
 
 class TechnicalStrategy:
     @staticmethod
@@ -22,100 +24,87 @@ class TechnicalStrategy:
                 "fallback_reason": error_msg
             }
 
-        df = pd.DataFrame(kline_data)
-        df['date'] = pd.to_datetime(df['date'])
+        close = np.fromiter((row['close'] for row in kline_data), dtype=float, count=len(kline_data))
+        dates = np.array([row['date'] for row in kline_data], dtype='datetime64[s]')
+        date_strs = np.datetime_as_string(dates, unit='D').tolist()
         
         # Calculate Indicators
-        df['MA5'] = df['close'].rolling(window=5).mean()
-        df['MA20'] = df['close'].rolling(window=20).mean()
-        df['MA60'] = df['close'].rolling(window=60).mean()
+        ma5 = rolling_mean(close, 5)
+        ma20 = rolling_mean(close, 20)
+        ma60 = rolling_mean(close, 60)
         
-        # RSI (14)
-        delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['RSI'] = 100 - (100 / (1 + rs))
+        # RSI (14, Wilder smoothing)
+        rsi = wilder_rsi(close, 14)
+        n_bars = close.size
         
-        trades = []
-        signals = []
-        position = None # {'date': ..., 'price': ...}
+        # Per-bar entry/exit conditions, evaluated for all bars at once (index i compares bar i with bar i-1).
+        # Bars before 60 are excluded so MA60 is valid.
+        valid = np.arange(n_bars) >= 60
+        # Strategy 1: Golden Cross (MA5 crosses above MA20) + Trend Filter (Price > MA60)
+        golden_cross = np.r_[False, (ma5[:-1] <= ma20[:-1]) & (ma5[1:] > ma20[1:])]
+        trend_up = close > ma60
+        # Strategy 2: RSI Oversold Bounce (RSI < 30 then crosses back up)
+        rsi_buy = np.r_[False, (rsi[:-1] < 30) & (rsi[1:] > 30)]
+        # Exit 1: Death Cross (MA5 crosses below MA20); Exit 2: RSI Overbought
+        death_cross = np.r_[False, (ma5[:-1] >= ma20[:-1]) & (ma5[1:] < ma20[1:])]
+        rsi_sell = rsi > 75
         
-        # Iterate through data to simulate trading
-        # Start from index 60 to have valid MA60
-        for i in range(60, len(df)):
-            curr = df.iloc[i]
-            prev = df.iloc[i-1]
-            date_str = curr['date'].strftime('%Y-%m-%d')
-            
-            # --- BUY LOGIC ---
-            if position is None:
-                # Strategy 1: Golden Cross (MA5 crosses above MA20) + Trend Filter (Price > MA60)
-                golden_cross = prev['MA5'] <= prev['MA20'] and curr['MA5'] > curr['MA20']
-                trend_up = curr['close'] > curr['MA60']
-                
-                # Strategy 2: RSI Oversold Bounce (RSI < 30 then crosses back up)
-                rsi_buy = prev['RSI'] < 30 and curr['RSI'] > 30
-                
-                if (golden_cross and trend_up) or rsi_buy:
-                    reason = "MA5/20 Golden Cross in Up Trend" if golden_cross else "RSI Oversold Rebound"
-                    position = {
-                        'buy_date': date_str,
-                        'buy_price': float(curr['close']),
-                        'buy_reason': reason
-                    }
-                    signals.append({"type": "BUY", "date": date_str, "price": float(curr['close']), "reason": reason})
-
-            # --- SELL LOGIC ---
-            elif position:
-                # Strategy 1: Death Cross (MA5 crosses below MA20)
-                death_cross = prev['MA5'] >= prev['MA20'] and curr['MA5'] < curr['MA20']
-                
-                # Strategy 2: RSI Overbought (RSI > 70)
-                rsi_sell = curr['RSI'] > 75
-                
-                # Strategy 3: Stop Loss (5%)
-                stop_loss = curr['close'] < position['buy_price'] * 0.95
-                
-                if death_cross or rsi_sell or stop_loss:
-                    sell_reason = "MA5/20 Death Cross" if death_cross else ("RSI Overbought" if rsi_sell else "Stop Loss Hit")
-                    
-                    # Calculate return
-                    ret_pct = ((curr['close'] - position['buy_price']) / position['buy_price']) * 100
-                    buy_dt = datetime.strptime(position['buy_date'], '%Y-%m-%d')
-                    sell_dt = curr['date'].to_pydatetime()
-                    days = (sell_dt - buy_dt).days
-                    
-                    trades.append({
-                        "buy_date": position['buy_date'],
-                        "buy_price": round(position['buy_price'], 2),
-                        "sell_date": date_str,
-                        "sell_price": round(float(curr['close']), 2),
-                        "status": "CLOSED",
-                        "holding_period": f"{days} days",
-                        "return_rate": f"{ret_pct:+.2f}%",
-                        "reason": f"Buy: {position['buy_reason']} | Sell: {sell_reason}"
-                    })
-                    signals.append({"type": "SELL", "date": date_str, "price": float(curr['close']), "reason": sell_reason})
-                    position = None
+        buy_idx = np.flatnonzero(valid & ((golden_cross & trend_up) | rsi_buy))
+        sell_idx = np.flatnonzero(valid & (death_cross | rsi_sell))
+        
+        # Position state machine only visits the bars where the rules fire (see simulate_long_positions)
+        buy_bars, sell_bars, open_bar = simulate_long_positions(close, buy_idx, sell_idx, STOP_LOSS_PCT, start=60)
+        
+        # Prices, returns and holding periods for all closed trades are computed as arrays and converted once
+        buy_prices = close[buy_bars]
+        sell_prices = close[sell_bars]
+        ret_pcts = ((sell_prices - buy_prices) / buy_prices * 100).tolist()
+        held_days = ((dates[sell_bars] - dates[buy_bars]) // np.timedelta64(1, 'D')).tolist()
+        buy_reasons = np.where(golden_cross[buy_bars], "MA5/20 Golden Cross in Up Trend", "RSI Oversold Rebound").tolist()
+        sell_reasons = np.where(death_cross[sell_bars], "MA5/20 Death Cross",
+                                np.where(rsi_sell[sell_bars], "RSI Overbought", "Stop Loss Hit")).tolist()
+        buy_dates = [date_strs[b] for b in buy_bars.tolist()]
+        sell_dates = [date_strs[sl] for sl in sell_bars.tolist()]
+        
+        trades = [
+            {
+                "buy_date": bd,
+                "buy_price": bp,
+                "sell_date": sd,
+                "sell_price": sp,
+                "status": "CLOSED",
+                "holding_period": f"{days} days",
+                "return_rate": f"{ret:+.2f}%",
+                "reason": f"Buy: {br} | Sell: {sr}"
+            }
+            for bd, bp, sd, sp, days, ret, br, sr in zip(
+                buy_dates, np.round(buy_prices, 2).tolist(), sell_dates, np.round(sell_prices, 2).tolist(),
+                held_days, ret_pcts, buy_reasons, sell_reasons)
+        ]
+        signals = []
+        for bd, bp, sd, sp, br, sr in zip(buy_dates, buy_prices.tolist(), sell_dates, sell_prices.tolist(),
+                                          buy_reasons, sell_reasons):
+            signals.append({"type": "BUY", "date": bd, "price": bp, "reason": br})
+            signals.append({"type": "SELL", "date": sd, "price": sp, "reason": sr})
 
         # Handle open position at the end
-        if position:
-            curr = df.iloc[-1]
-            date_str = curr['date'].strftime('%Y-%m-%d')
-            buy_dt = datetime.strptime(position['buy_date'], '%Y-%m-%d')
-            days = (curr['date'].to_pydatetime() - buy_dt).days
-            curr_ret = ((curr['close'] - position['buy_price']) / position['buy_price']) * 100
+        if open_bar is not None:
+            buy_reason = "MA5/20 Golden Cross in Up Trend" if golden_cross[open_bar] else "RSI Oversold Rebound"
+            buy_price = float(close[open_bar])
+            signals.append({"type": "BUY", "date": date_strs[open_bar], "price": buy_price, "reason": buy_reason})
+            last = n_bars - 1
+            days = int((dates[last] - dates[open_bar]) // np.timedelta64(1, 'D'))
+            curr_ret = ((close[last] - buy_price) / buy_price) * 100
             
             trades.append({
-                "buy_date": position['buy_date'],
-                "buy_price": round(position['buy_price'], 2),
+                "buy_date": date_strs[open_bar],
+                "buy_price": round(buy_price, 2),
                 "sell_date": None,
                 "sell_price": None,
                 "status": "HOLDING",
                 "holding_period": f"{days} days",
                 "return_rate": f"{curr_ret:+.2f}% (Open)",
-                "reason": f"Buy: {position['buy_reason']} | Still holding trend."
+                "reason": f"Buy: {buy_reason} | Still holding trend."
             })
 
         # Sort trades descending
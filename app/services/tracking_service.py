@@ -3,22 +3,34 @@ Stock Tracking Service
 Manages the curated stock tracking portfolio with AI-driven daily decisions.
 """
 
-import json
 import os
+import threading
 import time
-from datetime import datetime, date, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, date, time as dt_time, timedelta
 from typing import Optional, Dict, List
 from zoneinfo import ZoneInfo
 
+import numpy as np
 import yfinance as yf
 import pandas as pd
 
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
 from app import db
 from app.models.analysis import (
-    TrackingStock, TrackingTransaction, TrackingDailySnapshot, TrackingDecisionLog
+    TrackingStock, TrackingTransaction, TrackingDailySnapshot, TrackingDecisionLog,
+    BenchmarkPriceCache
 )
 from app.services.data_provider import DataProvider
 from app.services.ai_analyzer import AIAnalyzer
+from app.utils import json_codec
+from app.utils.log_queue import get_logger
+
+logger = get_logger(__name__)
 
 # Initial virtual capital
 INITIAL_CAPITAL = 100_000.0
@@ -31,9 +43,22 @@ BENCHMARK_SP500 = "SPY"
 BENCHMARK_NASDAQ100 = "QQQ"
 # Inception date for performance comparison
 INCEPTION_DATE = "2026-02-09"
+# Concurrent single-symbol price requests (kept small to stay under Yahoo's rate limit)
+PRICE_FETCH_WORKERS = 4
+# Prices fetched within this many seconds are reused for BUY/SELL execution
+PRICE_CACHE_TTL = 300
+# Benchmark downloads (which include today's still-moving bar) are reused for this many seconds
+BENCHMARK_DOWNLOAD_TTL = 3600
+BENCHMARK_DOWNLOAD_CACHE_SIZE = 32
+
+# SQL equivalents of TrackingStock.get_cost_amount() / get_shares() for column-level queries
+_STOCK_COST = func.coalesce(TrackingStock.cost_amount, PER_STOCK_ALLOCATION)
+_STOCK_SHARES = func.coalesce(TrackingStock.shares, _STOCK_COST / TrackingStock.buy_price)
 
 # US Eastern timezone for consistent date handling with US stock markets
 _US_EASTERN = ZoneInfo("America/New_York")
+# A session's daily bar is treated as final from this time on (a little after the 16:00 close)
+_SESSION_FINAL_TIME = dt_time(16, 30)
 
 
 def _us_eastern_today() -> date:
@@ -41,11 +66,59 @@ def _us_eastern_today() -> date:
     return datetime.now(_US_EASTERN).date()
 
 
+def _last_completed_session() -> date:
+    """Most recent weekday (US Eastern) whose regular session has closed. Exchange holidays are not
+    modelled: a holiday counts as a session, which only costs a (TTL-cached) download that finds no bar."""
+    now = datetime.now(_US_EASTERN)
+    day = now.date() if now.time() >= _SESSION_FINAL_TIME else now.date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def _holding_metrics(buy_prices: List[float], prices: List[float], shares: List[float]):
+    """Market value and return % of each holding, computed column-wise.
+    Returns (values, return_pcts) as float64 arrays aligned with the inputs."""
+    buy = np.asarray(buy_prices, dtype=np.float64)
+    price = np.asarray(prices, dtype=np.float64)
+    values = np.asarray(shares, dtype=np.float64) * price
+    return_pcts = ((price - buy) / buy) * 100
+    return values, return_pcts
+
+
+@dataclass
+class PortfolioState:
+    """Current tracking portfolio: holdings (as prompt/report dicts) plus cash-flow totals."""
+    holdings: List[Dict]
+    holdings_value: float
+    holdings_cost: float
+    cash: float
+    realized_pnl: float
+
+    @property
+    def num_holdings(self) -> int:
+        return len(self.holdings)
+
+    @property
+    def portfolio_value(self) -> float:
+        return self.cash + self.holdings_value
+
+
 class TrackingService:
     """Service for managing curated stock tracking portfolio."""
 
     def __init__(self):
         self.ai_analyzer = AIAnalyzer()
+        # _calculate_cash totals over all transactions: (txn_count, max_txn_id, (buy_cost, sell_returns, realized_pnl))
+        self._cash_totals = None
+        # Recently fetched prices: {symbol: (price, fetched_at)}
+        self._price_cache = {}
+        # Recent benchmark downloads: {(tickers, start, end): (fetched_at, {ticker: {date: close}})}
+        self._benchmark_downloads = {}
+        # Earliest start whose (tradingless) gap before a ticker's first cached close was already checked
+        self._benchmark_checked_from = {}
+        # Guards the two benchmark dicts above; they are used from comparison worker threads
+        self._benchmark_lock = threading.Lock()
 
     # ------------------------------------------------------------------
     # Sector/Industry helper
@@ -61,7 +134,7 @@ class TrackingService:
             industry = info.get('industry') or None
             return sector, industry
         except Exception as e:
-            print(f"[Tracking] Could not fetch sector/industry for {symbol}: {e}")
+            logger.warning("[Tracking] Could not fetch sector/industry for %s: %s", symbol, e)
             return None, None
 
     # ------------------------------------------------------------------
@@ -70,50 +143,136 @@ class TrackingService:
 
     def get_current_holdings(self) -> List[Dict]:
         """Get all currently tracked stocks with latest prices and allocation percentages."""
-        stocks = TrackingStock.query.order_by(TrackingStock.buy_date.asc()).all()
-        if not stocks:
+        S = TrackingStock
+        rows = db.session.execute(select(
+            S.id, S.symbol, S.name, S.buy_price, S.buy_date, S.current_price, S.sector, S.industry,
+            S.reason, S.created_at, S.updated_at, _STOCK_COST.label('cost_amount'), _STOCK_SHARES.label('shares')
+        ).order_by(S.buy_date.asc())).mappings().all()
+        if not rows:
             return []
 
         # Calculate total portfolio value (holdings + cash) for allocation %
         cash, _, _ = self._calculate_cash()
+        values, _ = _holding_metrics(
+            [r['buy_price'] for r in rows],
+            [r['current_price'] or r['buy_price'] for r in rows],
+            [r['shares'] for r in rows]
+        )
+        portfolio_value = cash + float(values.sum())
+        allocations = (values / portfolio_value * 100).round(2).tolist() if portfolio_value > 0 else [0] * len(rows)
 
-        # Compute each holding's current market value
-        holdings_data = []
-        total_holdings_value = 0.0
-        for s in stocks:
-            price = s.current_price or s.buy_price
-            cost = s.get_cost_amount()
-            shares = cost / s.buy_price
-            market_value = shares * price
-            total_holdings_value += market_value
-            holdings_data.append((s, shares, market_value))
-
-        portfolio_value = cash + total_holdings_value
-
-        # Build result with allocation_pct
+        # Same fields as TrackingStock.to_dict, plus position size and allocation
         result = []
-        for s, shares, market_value in holdings_data:
-            d = s.to_dict()
-            d['shares'] = round(shares, 4)
-            d['market_value'] = round(market_value, 2)
-            d['allocation_pct'] = round((market_value / portfolio_value) * 100, 2) if portfolio_value > 0 else 0
+        for r, market_value, allocation_pct in zip(rows, values.round(2).tolist(), allocations):
+            d = dict(r)
+            d['buy_date'] = r['buy_date'].strftime('%Y-%m-%d')
+            d['cost_amount'] = round(r['cost_amount'], 2)
+            d['unrealized_pct'] = round(((r['current_price'] - r['buy_price']) / r['buy_price']) * 100, 2) \
+                if r['current_price'] and r['buy_price'] and r['buy_price'] > 0 else None
+            d['created_at'] = r['created_at'].isoformat()
+            d['updated_at'] = r['updated_at'].isoformat()
+            d['shares'] = round(r['shares'], 4)
+            d['market_value'] = market_value
+            d['allocation_pct'] = allocation_pct
             result.append(d)
 
         return result
 
-    def get_transaction_history(self, limit: int = 50) -> List[Dict]:
-        """Get recent transaction history."""
-        txns = TrackingTransaction.query.order_by(
-            TrackingTransaction.date.desc()
-        ).limit(limit).all()
-        return [t.to_dict() for t in txns]
+    def _load_portfolio_state(self) -> PortfolioState:
+        """Current holdings (read as plain column rows) and cash-flow totals in one place."""
+        rows = db.session.query(
+            TrackingStock.symbol, TrackingStock.name, TrackingStock.buy_price, TrackingStock.buy_date,
+            TrackingStock.current_price, _STOCK_COST.label('cost_amount'), _STOCK_SHARES.label('shares')
+        ).order_by(TrackingStock.buy_date.asc()).all()
+
+        prices = [h.current_price or h.buy_price for h in rows]
+        values, return_pcts = _holding_metrics([h.buy_price for h in rows], prices, [h.shares for h in rows])
+        holdings = [{
+            'symbol': h.symbol,
+            'name': h.name or h.symbol,
+            'buy_price': h.buy_price,
+            'buy_date': h.buy_date.strftime('%Y-%m-%d'),
+            'current_price': price,
+            'cost_amount': round(h.cost_amount, 2),
+            'return_pct': ret,
+            'shares': round(h.shares, 4),
+            'value': value
+        } for h, price, value, ret in zip(rows, prices, values.round(2).tolist(), return_pcts.round(2).tolist())]
+
+        cash, _, total_realized_pnl = self._calculate_cash()
+        return PortfolioState(
+            holdings=holdings,
+            holdings_value=float(values.sum()),
+            holdings_cost=sum(h.cost_amount for h in rows),
+            cash=cash,
+            realized_pnl=total_realized_pnl
+        )
 
-    def get_decision_logs(self, limit: int = 30) -> List[Dict]:
-        """Get recent AI decision logs."""
-        logs = TrackingDecisionLog.query.order_by(
-            TrackingDecisionLog.date.desc()
-        ).limit(limit).all()
-        return [l.to_dict() for l in logs]
+    def get_transaction_history(self, limit: int = 50, before: str = None,
+                                before_id: int = None) -> List[Dict]:
+        """Get recent transaction history, newest first (same shape as TrackingTransaction.to_dict).
+        For the next page pass the last row's date (and id) as before / before_id."""
+        T = TrackingTransaction
+        stmt = select(
+            T.id, T.symbol, T.name, T.action, T.price, T.date, T.reason,
+            T.buy_price, T.realized_pct, T.cost_amount, T.created_at
+        )
+        if before:
+            stmt = stmt.where(self._older_than(T, before, before_id))
+        rows = db.session.execute(stmt.order_by(T.date.desc(), T.id.desc()).limit(limit)).mappings().all()
+        return [{
+            **r,
+            'date': r['date'].isoformat(),
+            'cost_amount': round(r['cost_amount'] if r['cost_amount'] is not None else PER_STOCK_ALLOCATION, 2),
+            'created_at': r['created_at'].isoformat()
+        } for r in rows]
+
+    def get_decision_logs(self, limit: int = 30, before: str = None,
+                          before_id: int = None) -> List[Dict]:
+        """Get recent AI decision logs, newest first (paged like get_transaction_history).
+        Reads only the listed columns, so raw_response is never loaded."""
+        L = TrackingDecisionLog
+        stmt = select(
+            L.id, L.date, L.model_name, L.has_changes, L.summary, L.actions_json, L.elapsed_seconds,
+            L.market_regime, L.confidence_level, L.report_json, L.accuracy_score, L.accuracy_details,
+            L.created_at
+        )
+        if before:
+            stmt = stmt.where(self._older_than(L, before, before_id))
+        rows = db.session.execute(stmt.order_by(L.date.desc(), L.id.desc()).limit(limit)).mappings().all()
+        return [{
+            'id': r['id'],
+            'date': r['date'].isoformat(),
+            'model_name': r['model_name'],
+            'has_changes': r['has_changes'],
+            'summary': r['summary'],
+            'actions': self._parse_json_column(r['actions_json']) or [],
+            'elapsed_seconds': r['elapsed_seconds'],
+            'market_regime': r['market_regime'],
+            'confidence_level': r['confidence_level'],
+            'report': self._parse_json_column(r['report_json']),
+            'accuracy_score': r['accuracy_score'],
+            'accuracy_details': self._parse_json_column(r['accuracy_details']),
+            'created_at': r['created_at'].isoformat()
+        } for r in rows]
+
+    @staticmethod
+    def _parse_json_column(text):
+        """Parse a JSON text column, returning None when empty or malformed (as the model to_dicts do)."""
+        if not text:
+            return None
+        try:
+            return json_codec.loads(text)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _older_than(model, before: str, before_id: int = None):
+        """Keyset filter: rows strictly after the (date, id) cursor in newest-first order."""
+        before_date = datetime.strptime(before, '%Y-%m-%d').date()
+        if before_id is None:
+            return model.date < before_date
+        return or_(model.date < before_date, and_(model.date == before_date, model.id < before_id))
 
     def get_daily_snapshots(self, start_date: str = None) -> List[Dict]:
         """Get daily portfolio value snapshots."""
@@ -125,31 +284,24 @@ class TrackingService:
 
     def get_portfolio_summary(self) -> Dict:
         """Get portfolio summary including performance metrics."""
-        holdings = TrackingStock.query.all()
-
-        total_holdings_value = 0.0
-        total_cost = 0.0
-        for h in holdings:
-            price = h.current_price or h.buy_price
-            cost = h.get_cost_amount()
-            total_holdings_value += price * (cost / h.buy_price)
-            total_cost += cost
-
-        # Calculate cash using flow-based method (replay all transactions)
-        num_current = len(holdings)
-        cash, total_sell_returns, total_realized_pnl = self._calculate_cash()
-        portfolio_value = cash + total_holdings_value
+        state = self._load_portfolio_state()
+        total_holdings_value = state.holdings_value
+        total_cost = state.holdings_cost
+        num_current = state.num_holdings
+        cash = state.cash
+        total_realized_pnl = state.realized_pnl
+        portfolio_value = state.portfolio_value
         total_return_pct = ((portfolio_value - INITIAL_CAPITAL) / INITIAL_CAPITAL) * 100
 
-        # Latest snapshot
-        latest_snapshot = TrackingDailySnapshot.query.order_by(
-            TrackingDailySnapshot.date.desc()
-        ).first()
-
-        # Latest decision
-        latest_decision = TrackingDecisionLog.query.order_by(
-            TrackingDecisionLog.date.desc()
-        ).first()
+        # Latest snapshot date and latest decision in one round trip (each a backward scan of its date index)
+        latest_decision = select(TrackingDecisionLog.date, TrackingDecisionLog.has_changes).order_by(
+            TrackingDecisionLog.date.desc(), TrackingDecisionLog.id.desc()
+        ).limit(1)
+        latest = db.session.execute(select(
+            select(func.max(TrackingDailySnapshot.date)).scalar_subquery().label('snapshot_date'),
+            latest_decision.with_only_columns(TrackingDecisionLog.date).scalar_subquery().label('decision_date'),
+            latest_decision.with_only_columns(TrackingDecisionLog.has_changes).scalar_subquery().label('has_changes')
+        )).one()
 
         return {
             'initial_capital': INITIAL_CAPITAL,
@@ -158,14 +310,14 @@ class TrackingService:
             'holdings_value': round(total_holdings_value, 2),
             'total_return_pct': round(total_return_pct, 2),
             'realized_pnl': round(total_realized_pnl, 2),
-            'unrealized_pnl': round(total_holdings_value - total_cost, 2) if holdings else 0,
+            'unrealized_pnl': round(total_holdings_value - total_cost, 2) if num_current else 0,
             'num_holdings': num_current,
             'max_holdings': MAX_HOLDINGS,
             'per_stock_allocation': PER_STOCK_ALLOCATION,
             'inception_date': INCEPTION_DATE,
-            'last_snapshot_date': latest_snapshot.date.strftime('%Y-%m-%d') if latest_snapshot else None,
-            'last_decision_date': latest_decision.date.strftime('%Y-%m-%d') if latest_decision else None,
-            'last_decision_has_changes': latest_decision.has_changes if latest_decision else None,
+            'last_snapshot_date': latest.snapshot_date.strftime('%Y-%m-%d') if latest.snapshot_date else None,
+            'last_decision_date': latest.decision_date.strftime('%Y-%m-%d') if latest.decision_date else None,
+            'last_decision_has_changes': latest.has_changes if latest.decision_date else None,
         }
 
     def get_benchmark_comparison(self, start_date: str = None) -> Dict:
@@ -178,130 +330,251 @@ class TrackingService:
         if not start_date:
             start_date = INCEPTION_DATE
 
-        snapshots = TrackingDailySnapshot.query.filter(
-            TrackingDailySnapshot.date >= start_date
-        ).order_by(TrackingDailySnapshot.date.asc()).all()
-
         # Determine date range: always start from inception, end at today or last snapshot
-        today_str = _us_eastern_today().strftime('%Y-%m-%d')
-        if snapshots:
-            last_date = max(snapshots[-1].date.strftime('%Y-%m-%d'), today_str)
+        today_str = _us_eastern_today().isoformat()
+        last_snapshot_date = db.session.query(func.max(TrackingDailySnapshot.date)).filter(
+            TrackingDailySnapshot.date >= start_date
+        ).scalar()
+        if last_snapshot_date:
+            last_date = max(last_snapshot_date.isoformat(), today_str)
         else:
             last_date = today_str
 
-        # Fetch benchmark data from inception to present
-        sp500_data = self._get_benchmark_series(BENCHMARK_SP500, start_date, last_date)
-        nasdaq_data = self._get_benchmark_series(BENCHMARK_NASDAQ100, start_date, last_date)
+        # Fetch benchmark data from inception to present (both tickers in one request) on a worker
+        # thread with its own app context, while the snapshots are loaded here
+        app = current_app._get_current_object()
+
+        def load_benchmarks():
+            with app.app_context():
+                return self._get_benchmark_series_batch(
+                    [BENCHMARK_SP500, BENCHMARK_NASDAQ100], start_date, last_date
+                )
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            benchmarks_future = pool.submit(load_benchmarks)
+            snapshots = db.session.query(TrackingDailySnapshot.date, TrackingDailySnapshot.total_return_pct).filter(
+                TrackingDailySnapshot.date >= start_date
+            ).order_by(TrackingDailySnapshot.date.asc()).all()
+            benchmarks = benchmarks_future.result()
+        sp500_data = benchmarks[BENCHMARK_SP500]
+        nasdaq_data = benchmarks[BENCHMARK_NASDAQ100]
 
         if not sp500_data and not nasdaq_data:
             return {'portfolio': [], 'sp500': [], 'nasdaq100': [], 'dates': [], 'portfolio_start_index': None}
 
-        # Build snapshot lookup
-        snapshot_map = {}
-        for snap in snapshots:
-            snapshot_map[snap.date.strftime('%Y-%m-%d')] = snap
+        def date_series(values_by_date):
+            # String date index even when empty, so unions/comparisons with date strings work
+            return pd.Series(list(values_by_date.values()), index=pd.Index(list(values_by_date), dtype=object),
+                             dtype=float)
 
-        # Build date list: include inception, all benchmark dates, AND all snapshot dates
-        benchmark_dates = set(list(sp500_data.keys()) + list(nasdaq_data.keys()))
-        all_dates_set = set(benchmark_dates)
-        # Always include inception date as the first point (even if it's a weekend)
-        all_dates_set.add(start_date)
+        sp500 = date_series(sp500_data)
+        nasdaq = date_series(nasdaq_data)
         # Include snapshot dates, but cap at the latest benchmark date to avoid
         # timezone mismatch (e.g. local date is 2/12 but US markets haven't opened yet,
         # so benchmark data only goes to 2/11).
-        latest_benchmark_date = max(benchmark_dates) if benchmark_dates else today_str
-        for snap_date_str in snapshot_map.keys():
-            if snap_date_str <= latest_benchmark_date:
-                all_dates_set.add(snap_date_str)
-        all_dates = sorted(all_dates_set)
-
-        # Rebase benchmarks: find the first available benchmark value and subtract it
-        # so the curve starts at 0% on (or near) inception date.
-        first_sp500_val = None
-        first_nasdaq_val = None
-        for d in all_dates:
-            if first_sp500_val is None and d in sp500_data:
-                first_sp500_val = sp500_data[d]
-            if first_nasdaq_val is None and d in nasdaq_data:
-                first_nasdaq_val = nasdaq_data[d]
-            if first_sp500_val is not None and first_nasdaq_val is not None:
-                break
-        if first_sp500_val is None:
-            first_sp500_val = 0.0
-        if first_nasdaq_val is None:
-            first_nasdaq_val = 0.0
-
-        # Find where portfolio data begins
-        first_snapshot_date = snapshots[0].date.strftime('%Y-%m-%d') if snapshots else None
-        portfolio_start_index = None
-
-        dates = []
-        portfolio_series = []
-        sp500_series = []
-        nasdaq_series = []
-
-        last_portfolio_value = None  # For forward-filling gaps between snapshots
-
-        for d in all_dates:
-            dates.append(d)
-
-            # Benchmark values rebased to 0 at inception
-            sp_val = sp500_data.get(d)
-            nq_val = nasdaq_data.get(d)
-            if d == start_date:
-                # Force 0 at inception, even if benchmark has no data for this date
-                sp500_series.append(0.0)
-                nasdaq_series.append(0.0)
-            else:
-                sp500_series.append(round(sp_val - first_sp500_val, 2) if sp_val is not None else None)
-                nasdaq_series.append(round(nq_val - first_nasdaq_val, 2) if nq_val is not None else None)
-
-            # Portfolio series: use actual total_return_pct (already 0 at inception)
-            snap = snapshot_map.get(d)
-            if snap:
-                val = round(snap.total_return_pct, 2)
-                portfolio_series.append(val)
-                last_portfolio_value = val
-                if portfolio_start_index is None:
-                    portfolio_start_index = len(dates) - 1
-            elif last_portfolio_value is not None:
-                # Forward-fill for dates without a snapshot (e.g. weekends in between)
-                portfolio_series.append(last_portfolio_value)
-            else:
-                # Before the first snapshot, no data
-                portfolio_series.append(None)
-
+        latest_benchmark_date = max(sp500.index.union(nasdaq.index))
+        portfolio = date_series({
+            snap.date.isoformat(): round(snap.total_return_pct, 2)
+            for snap in snapshots
+        })
+        portfolio = portfolio[portfolio.index <= latest_benchmark_date]
+
+        # Date axis: inception (even if it's a weekend), all benchmark dates and all snapshot dates, sorted
+        all_dates = sp500.index.union(nasdaq.index).union(portfolio.index).union(pd.Index([start_date]))
+        df = pd.DataFrame({'sp500': sp500, 'nasdaq100': nasdaq, 'portfolio': portfolio}).reindex(all_dates)
+
+        # Rebase benchmarks: subtract the first available value so the curve starts at 0% on (or near)
+        # inception date; force exactly 0 at inception even if the benchmark has no data for it
+        benchmarks = df[['sp500', 'nasdaq100']]
+        first_values = benchmarks.bfill().iloc[0].fillna(0.0)
+        df[['sp500', 'nasdaq100']] = (benchmarks - first_values).round(2)
+        df.loc[start_date, ['sp500', 'nasdaq100']] = 0.0
+
+        # Portfolio series: actual total_return_pct (already 0 at inception), forward-filled across
+        # dates without a snapshot (e.g. weekends); no data before the first snapshot
+        has_portfolio = df['portfolio'].notna().to_numpy()
+        portfolio_start_index = int(has_portfolio.argmax()) if has_portfolio.any() else None
+        df['portfolio'] = df['portfolio'].ffill()
+
+        series = df.astype(object).where(df.notna(), None).to_dict('list')
         return {
-            'dates': dates,
-            'portfolio': portfolio_series,
-            'sp500': sp500_series,
-            'nasdaq100': nasdaq_series,
+            'dates': all_dates.tolist(),
+            'portfolio': series['portfolio'],
+            'sp500': series['sp500'],
+            'nasdaq100': series['nasdaq100'],
             'portfolio_start_index': portfolio_start_index
         }
 
-    def _get_benchmark_series(self, ticker: str, start_date: str, end_date: str) -> Dict[str, float]:
-        """Fetch benchmark return series as {date_str: return_pct}."""
+    def _get_benchmark_series_batch(self, tickers: List[str], start_date: str,
+                                    end_date: str) -> Dict[str, Dict[str, float]]:
+        """Return benchmark return series for several tickers as {ticker: {date_str: return_pct}}.
+        A ticker without data maps to {}."""
+        closes = self._load_benchmark_closes(tickers, start_date, end_date)
+        result = {}
+        for ticker in tickers:
+            series = closes[ticker]
+            if not series:
+                result[ticker] = {}
+                continue
+            dates = sorted(series)
+            close = np.fromiter((series[d] for d in dates), dtype=np.float64, count=len(dates))
+            rets = np.round((close / close[0] - 1.0) * 100.0, 2)
+            result[ticker] = dict(zip(dates, rets.tolist()))
+        return result
+
+    def _load_benchmark_closes(self, tickers: List[str], start_date: str,
+                               end_date: str) -> Dict[str, Dict[str, float]]:
+        """
+        Daily closes for the benchmark tickers as {ticker: {date_str: close}}.
+        Completed sessions are served from BenchmarkPriceCache; only the days
+        missing before the first or after the last cached close are downloaded
+        (one request for all tickers) and added to the cache. A session still
+        trading is returned but not cached, since its bar keeps changing until
+        the close.
+        """
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
+        today = _us_eastern_today()
+        session = _last_completed_session()
+
+        # Cached range per ticker: {ticker: (first_date, last_date)}
+        coverage = {
+            row.ticker: (row.first_date, row.last_date)
+            for row in db.session.query(
+                BenchmarkPriceCache.ticker,
+                func.min(BenchmarkPriceCache.date).label('first_date'),
+                func.max(BenchmarkPriceCache.date).label('last_date')
+            ).filter(BenchmarkPriceCache.ticker.in_(tickers)).group_by(BenchmarkPriceCache.ticker)
+        }
+        # A cache starting after start only lacks a prefix if a trading day falls in [start, first);
+        # a weekend start is already covered, and a prefix found empty once (holidays) is remembered
+        with self._benchmark_lock:
+            checked_from = dict(self._benchmark_checked_from)
+        missing_prefix = {
+            t for t, (first, _) in coverage.items()
+            if start < checked_from.get(t, first)
+            and len(pd.bdate_range(start, first - timedelta(days=1)))
+        }
+
+        # Re-download the last cached day too: it links the new (freshly adjusted) bars to the cached ones
+        if missing_prefix or not all(t in coverage for t in tickers):
+            fetch_from = start
+        else:
+            fetch_from = min(last for _, last in coverage.values())
+        # A missing prefix is linked through the first cached bar, so the download must reach it
+        fetch_to = max([end] + [coverage[t][0] for t in missing_prefix])
+        # A weekday session in progress (end reaches today, which has not closed yet) only exists live
+        in_progress = session < today <= end and today.weekday() < 5
+        covered_to = min(end, session)
+        if not in_progress and not missing_prefix and all(
+                t in coverage and coverage[t][1] >= covered_to for t in tickers):
+            # Every completed session in the range is already cached for every ticker
+            fresh = {t: {} for t in tickers}
+        else:
+            fresh = self._recent_benchmark_download(tickers, fetch_from, fetch_to)
+
+        # First and last cached close per ticker, read together in one query
+        edge_closes = {}
+        if coverage:
+            edge_closes = {
+                (t, d): c for t, d, c in db.session.query(
+                    BenchmarkPriceCache.ticker, BenchmarkPriceCache.date, BenchmarkPriceCache.close
+                ).filter(or_(*(
+                    and_(BenchmarkPriceCache.ticker == t, BenchmarkPriceCache.date.in_([first, last]))
+                    for t, (first, last) in coverage.items()
+                )))
+            }
+
+        new_rows = []
+        for ticker, series in fresh.items():
+            if ticker in coverage:
+                first, last = coverage[ticker]
+                # Adjusted history is rescaled after every dividend; rescale the download onto the cached basis
+                # through a bar present in both. Without one the two cannot be linked, so nothing is added this time.
+                link = next((d for d in (last, first) if edge_closes.get((ticker, d)) and series.get(d)), None)
+                if link is not None:
+                    ratio = edge_closes[(ticker, link)] / series[link]
+                    series = {d: c * ratio for d, c in series.items() if d < first or d > last}
+                    if ticker in missing_prefix and not any(d < first for d in series):
+                        with self._benchmark_lock:
+                            self._benchmark_checked_from[ticker] = start
+                else:
+                    series = {}
+                fresh[ticker] = series
+            new_rows.extend({'ticker': ticker, 'date': d, 'close': c} for d, c in series.items() if d <= session)
+
+        if new_rows:
+            try:
+                db.session.bulk_insert_mappings(BenchmarkPriceCache, new_rows)
+                db.session.commit()
+            except IntegrityError:
+                # Another request cached the same days concurrently
+                db.session.rollback()
+
+        result = {t: {} for t in tickers}
+        cached = db.session.query(
+            BenchmarkPriceCache.ticker, BenchmarkPriceCache.date, BenchmarkPriceCache.close
+        ).filter(
+            BenchmarkPriceCache.ticker.in_(tickers),
+            BenchmarkPriceCache.date >= start,
+            BenchmarkPriceCache.date <= end + timedelta(days=3)
+        ).order_by(BenchmarkPriceCache.ticker, BenchmarkPriceCache.date)
+        for ticker, d, close in cached:
+            result[ticker][d.isoformat()] = close
+        # The in-progress (uncached) bar comes straight from the download
+        for ticker, series in fresh.items():
+            for d, close in series.items():
+                if d > session:
+                    result[ticker][d.isoformat()] = close
+        return result
+
+    def _recent_benchmark_download(self, tickers: List[str], start: date, end: date) -> Dict[str, Dict[date, float]]:
+        """_download_benchmark_closes, reusing an identical download from the last BENCHMARK_DOWNLOAD_TTL seconds."""
+        key = (tuple(tickers), start, end)
+        with self._benchmark_lock:
+            hit = self._benchmark_downloads.get(key)
+        if hit is not None and time.time() - hit[0] < BENCHMARK_DOWNLOAD_TTL:
+            fresh = hit[1]
+        else:
+            # Downloaded outside the lock; two concurrent misses may both download, and the last one is kept
+            fresh = self._download_benchmark_closes(tickers, start, end)
+            # Failed downloads come back empty and are not cached, so the next request retries
+            if any(fresh.values()):
+                with self._benchmark_lock:
+                    if key not in self._benchmark_downloads and \
+                            len(self._benchmark_downloads) >= BENCHMARK_DOWNLOAD_CACHE_SIZE:
+                        self._benchmark_downloads.pop(next(iter(self._benchmark_downloads)), None)
+                    self._benchmark_downloads[key] = (time.time(), fresh)
+        # Callers rewrite the per-ticker series, so hand out copies
+        return {t: dict(series) for t, series in fresh.items()}
+
+    @staticmethod
+    def _download_benchmark_closes(tickers: List[str], start: date, end: date) -> Dict[str, Dict[date, float]]:
+        """Download daily adjusted closes for several tickers with a single yfinance request."""
+        result = {t: {} for t in tickers}
         try:
             # Add buffer days for the end date
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=3)
-            hist = yf.Ticker(ticker).history(
-                start=start_date,
-                end=end_dt.strftime('%Y-%m-%d'),
-                auto_adjust=True
+            hist = yf.download(
+                tickers,
+                start=start.strftime('%Y-%m-%d'),
+                end=(end + timedelta(days=3)).strftime('%Y-%m-%d'),
+                auto_adjust=True,
+                group_by='ticker',
+                threads=True,
+                progress=False
             )
             if hist is None or hist.empty:
-                return {}
-
-            base_price = float(hist['Close'].iloc[0])
-            result = {}
-            for idx, row in hist.iterrows():
-                d = idx.strftime('%Y-%m-%d')
-                ret = ((float(row['Close']) - base_price) / base_price) * 100
-                result[d] = round(ret, 2)
-            return result
+                return result
+
+            for ticker in tickers:
+                if ticker not in hist.columns.get_level_values(0):
+                    continue
+                # Rows are the union of all tickers' trading days; keep this ticker's own bars
+                close = hist[ticker]['Close'].dropna()
+                result[ticker] = dict(zip(close.index.date, close.tolist()))
         except Exception as e:
-            print(f"Error fetching benchmark {ticker}: {e}")
-            return {}
+            logger.error("Error fetching benchmarks %s: %s", tickers, e)
+        return result
 
     # ------------------------------------------------------------------
     # Price refresh
@@ -309,81 +582,69 @@ class TrackingService:
 
     def refresh_prices(self) -> Dict:
         """Update current prices for all tracked stocks using batch download to avoid rate limits."""
-        stocks = TrackingStock.query.all()
-        if not stocks:
+        # Only the key and symbol are needed; prices are written back in a single UPDATE
+        stock_ids = dict(db.session.query(TrackingStock.symbol, TrackingStock.id).all())
+        if not stock_ids:
             return {'updated': 0, 'total': 0}
 
-        symbols = [s.symbol for s in stocks]
-        updated = 0
-        stock_map = {s.symbol: s for s in stocks}
+        symbols = list(stock_ids)
+
+        # Batch download: single API call for all symbols; batch prices are stored at 2 decimals as before
+        refreshed = {
+            sym: round(price, 2) for sym, price in DataProvider.get_current_prices(symbols).items()
+        }  # symbol -> new price
+
+        # Retry any symbol the batch did not return (missing or NaN) individually after a short delay
+        failed_symbols = [s for s in symbols if s not in refreshed]
+        if failed_symbols:
+            logger.info("[Tracking] Retrying %s failed symbols after delay: %s", len(failed_symbols), failed_symbols)
+            time.sleep(5)
+            refreshed.update(self._fetch_current_prices(failed_symbols))
+
+        fetched_at = time.time()
+        for sym, price in refreshed.items():
+            # Remembered so BUY/SELL right after a refresh can skip another request
+            self._price_cache[sym] = (price, fetched_at)
+
+        if refreshed:
+            # One UPDATE ... SET current_price = CASE id WHEN ... END for all refreshed rows
+            new_prices = {stock_ids[sym]: price for sym, price in refreshed.items()}
+            db.session.execute(
+                update(TrackingStock)
+                .where(TrackingStock.id.in_(new_prices))
+                .values(current_price=case(new_prices, value=TrackingStock.id))
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        return {'updated': len(refreshed), 'total': len(stock_ids)}
 
-        try:
-            # Batch download: single API call for all symbols
-            data = yf.download(symbols, period='1d', auto_adjust=True, progress=False)
-            if data is not None and not data.empty:
-                close = data['Close']
-                if isinstance(close, pd.Series):
-                    # Single symbol case
-                    price = float(close.iloc[-1]) if not pd.isna(close.iloc[-1]) else None
-                    if price is not None:
-                        stocks[0].current_price = round(price, 2)
-                        updated = 1
-                else:
-                    # Multiple symbols
-                    for sym in symbols:
-                        if sym in close.columns:
-                            val = close[sym].iloc[-1]
-                            if not pd.isna(val):
-                                stock_map[sym].current_price = round(float(val), 2)
-                                updated += 1
-
-            # Retry failed symbols individually after a short delay
-            if updated < len(stocks):
-                failed_symbols = [s for s in symbols if stock_map[s].current_price is None or
-                                  s not in (close.columns if not isinstance(close, pd.Series) else [symbols[0]])]
-                # Also catch symbols whose batch value was NaN
-                failed_symbols = [s for s in symbols
-                                  if stock_map[s].current_price == stock_map[s].buy_price and
-                                  stock_map[s].current_price is not None]
-                # Simpler: just retry any stock that wasn't updated
-                updated_syms = set()
-                if isinstance(close, pd.Series):
-                    if not pd.isna(close.iloc[-1]):
-                        updated_syms.add(symbols[0])
-                else:
-                    for sym in symbols:
-                        if sym in close.columns and not pd.isna(close[sym].iloc[-1]):
-                            updated_syms.add(sym)
-
-                failed_symbols = [s for s in symbols if s not in updated_syms]
-                if failed_symbols:
-                    print(f"[Tracking] Retrying {len(failed_symbols)} failed symbols after delay: {failed_symbols}")
-                    time.sleep(5)
-                    for sym in failed_symbols:
-                        try:
-                            price = DataProvider.get_current_price(sym)
-                            if price is not None:
-                                stock_map[sym].current_price = price
-                                updated += 1
-                            time.sleep(2)
-                        except Exception as ex:
-                            print(f"  Retry failed for {sym}: {ex}")
+    def _current_price(self, symbol: str) -> Optional[float]:
+        """Current price for symbol, reusing a price fetched within PRICE_CACHE_TTL seconds."""
+        cached = self._price_cache.get(symbol)
+        if cached is not None and time.time() - cached[1] < PRICE_CACHE_TTL:
+            return cached[0]
+        price = DataProvider.get_current_price(symbol)
+        if price is not None:
+            self._price_cache[symbol] = (price, time.time())
+        return price
 
-        except Exception as e:
-            print(f"[Tracking] Batch price download failed: {e}, falling back to individual fetch")
-            # Fallback: fetch individually with a small delay to reduce rate limit risk
-            for stock in stocks:
+    @staticmethod
+    def _fetch_current_prices(symbols: List[str]) -> Dict[str, float]:
+        """Fetch current prices one symbol per request, a few requests in flight at a time.
+        Returns {symbol: price} for the symbols that resolved."""
+        prices = {}
+        with ThreadPoolExecutor(max_workers=min(PRICE_FETCH_WORKERS, len(symbols))) as pool:
+            future_to_symbol = {pool.submit(DataProvider.get_current_price, sym): sym for sym in symbols}
+            for future in as_completed(future_to_symbol):
+                sym = future_to_symbol[future]
                 try:
-                    price = DataProvider.get_current_price(stock.symbol)
-                    if price is not None:
-                        stock.current_price = price
-                        updated += 1
-                    time.sleep(2)
+                    price = future.result()
                 except Exception as ex:
-                    print(f"  Error refreshing price for {stock.symbol}: {ex}")
-
-        db.session.commit()
-        return {'updated': updated, 'total': len(stocks)}
+                    logger.error("  Error refreshing price for %s: %s", sym, ex)
+                    continue
+                if price is not None:
+                    prices[sym] = price
+        return prices
 
     # ------------------------------------------------------------------
     # Daily snapshot
@@ -405,92 +666,105 @@ class TrackingService:
         if snapshot_date is None:
             snapshot_date = _us_eastern_today()
 
-        is_today = (snapshot_date == _us_eastern_today())
-
         # --- Step 1: Reconstruct holdings as of snapshot_date ---
         holdings_at_date, sell_txns_at_date = self._reconstruct_holdings_at_date(snapshot_date)
 
         # --- Step 2: Get prices for each holding ---
-        # For today, prefer live DB prices; for historical dates, use cache or yfinance
-        symbols_needing_price = [h['symbol'] for h in holdings_at_date]
-
-        if is_today:
-            # Use current DB prices (already refreshed by refresh_prices)
-            current_stocks = {s.symbol: s for s in TrackingStock.query.all()}
-            for h in holdings_at_date:
-                stock = current_stocks.get(h['symbol'])
-                if stock and stock.current_price:
-                    h['current_price'] = stock.current_price
-                else:
-                    h['current_price'] = h['buy_price']
-        else:
-            # Historical date: use price_cache or fetch from yfinance
-            date_str = snapshot_date.strftime('%Y-%m-%d')
-            historical_prices = {}
-            if price_cache:
-                for sym in symbols_needing_price:
-                    if sym in price_cache and date_str in price_cache[sym]:
-                        historical_prices[sym] = price_cache[sym][date_str]
-
-            # Fetch missing prices
-            missing = [s for s in symbols_needing_price if s not in historical_prices]
-            if missing:
-                fetched = self._get_historical_prices(missing, snapshot_date)
-                historical_prices.update(fetched)
-
-            for h in holdings_at_date:
-                h['current_price'] = historical_prices.get(h['symbol'], h['buy_price'])
+        self._apply_snapshot_prices(holdings_at_date, snapshot_date, price_cache)
 
         # --- Step 3: Calculate portfolio values ---
-        total_holdings_value = 0.0
-        holdings_snapshot = []
-        for h in holdings_at_date:
-            price = h['current_price']
-            buy_price = h['buy_price']
-            cost = h.get('cost_amount', PER_STOCK_ALLOCATION)
-            shares = cost / buy_price
-            value = shares * price
-            total_holdings_value += value
-            holdings_snapshot.append({
-                'symbol': h['symbol'],
-                'name': h['name'],
-                'buy_price': buy_price,
-                'current_price': price,
-                'cost_amount': round(cost, 2),
-                'shares': round(shares, 4),
-                'value': round(value, 2),
-                'return_pct': round(((price - buy_price) / buy_price) * 100, 2)
-            })
-
-        # Calculate cash using flow-based method (replay all transactions up to snapshot_date)
+        # Cash uses the flow-based method (all transactions up to snapshot_date)
         cash, total_sell_returns, total_realized_pnl = self._calculate_cash(as_of_date=snapshot_date)
-        portfolio_value = cash + total_holdings_value
-        total_return_pct = ((portfolio_value - INITIAL_CAPITAL) / INITIAL_CAPITAL) * 100
+        fields = self._snapshot_fields(holdings_at_date, cash, total_realized_pnl)
 
         # --- Step 4: Upsert snapshot ---
-        existing = TrackingDailySnapshot.query.filter_by(date=snapshot_date).first()
-        if existing:
-            existing.portfolio_value = round(portfolio_value, 2)
-            existing.cash = round(cash, 2)
-            existing.holdings_value = round(total_holdings_value, 2)
-            existing.total_return_pct = round(total_return_pct, 4)
-            existing.realized_pnl = round(total_realized_pnl, 2)
-            existing.holdings_json = json.dumps(holdings_snapshot)
-            db.session.commit()
-            return existing.to_dict()
-
-        snapshot = TrackingDailySnapshot(
-            date=snapshot_date,
-            portfolio_value=round(portfolio_value, 2),
-            cash=round(cash, 2),
-            holdings_value=round(total_holdings_value, 2),
-            total_return_pct=round(total_return_pct, 4),
-            realized_pnl=round(total_realized_pnl, 2),
-            holdings_json=json.dumps(holdings_snapshot)
-        )
-        db.session.add(snapshot)
+        self._upsert_snapshot(snapshot_date, fields)
         db.session.commit()
-        return snapshot.to_dict()
+        return TrackingDailySnapshot.query.filter_by(date=snapshot_date).first().to_dict()
+
+    @staticmethod
+    def _upsert_snapshot(snapshot_date: date, fields: Dict):
+        """
+        Insert the snapshot for snapshot_date, or overwrite its values if one exists,
+        in a single statement keyed on the unique date (no check-then-insert race).
+        """
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(TrackingDailySnapshot.__table__).values(date=snapshot_date, **fields)
+            stmt = stmt.on_conflict_do_update(index_elements=['date'], set_=fields)
+        elif dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(TrackingDailySnapshot.__table__).values(date=snapshot_date, **fields)
+            stmt = stmt.on_duplicate_key_update(**fields)
+        else:
+            existing = TrackingDailySnapshot.query.filter_by(date=snapshot_date).first()
+            if existing:
+                for key, value in fields.items():
+                    setattr(existing, key, value)
+            else:
+                db.session.add(TrackingDailySnapshot(date=snapshot_date, **fields))
+            return
+        db.session.execute(stmt)
+
+    def _apply_snapshot_prices(self, holdings: List[Dict], snapshot_date: date,
+                               price_cache: Dict[str, Dict[str, float]] = None):
+        """Set 'current_price' on each holding dict for snapshot_date.
+        Today uses live DB prices; historical dates use price_cache, then yfinance."""
+        if snapshot_date == _us_eastern_today():
+            # Use current DB prices (already refreshed by refresh_prices)
+            current_prices = dict(db.session.query(TrackingStock.symbol, TrackingStock.current_price))
+            for h in holdings:
+                h['current_price'] = current_prices.get(h['symbol']) or h['buy_price']
+            return
+
+        # Historical date: use price_cache or fetch from yfinance
+        date_str = snapshot_date.strftime('%Y-%m-%d')
+        historical_prices = {}
+        if price_cache:
+            for h in holdings:
+                sym = h['symbol']
+                if sym in price_cache and date_str in price_cache[sym]:
+                    historical_prices[sym] = price_cache[sym][date_str]
+
+        # Fetch missing prices
+        missing = [h['symbol'] for h in holdings if h['symbol'] not in historical_prices]
+        if missing:
+            historical_prices.update(self._get_historical_prices(missing, snapshot_date))
+
+        for h in holdings:
+            h['current_price'] = historical_prices.get(h['symbol'], h['buy_price'])
+
+    @staticmethod
+    def _snapshot_fields(holdings: List[Dict], cash: float, total_realized_pnl: float) -> Dict:
+        """Column values of a TrackingDailySnapshot for priced holdings and the cash position."""
+        values, return_pcts = _holding_metrics(
+            [h['buy_price'] for h in holdings],
+            [h['current_price'] for h in holdings],
+            [h['shares'] for h in holdings]
+        )
+        total_holdings_value = float(values.sum())
+        holdings_snapshot = [{
+            'symbol': h['symbol'],
+            'name': h['name'],
+            'buy_price': h['buy_price'],
+            'current_price': h['current_price'],
+            'cost_amount': round(h.get('cost_amount', PER_STOCK_ALLOCATION), 2),
+            'shares': round(h['shares'], 4),
+            'value': value,
+            'return_pct': ret
+        } for h, value, ret in zip(holdings, values.round(2).tolist(), return_pcts.round(2).tolist())]
+
+        portfolio_value = cash + total_holdings_value
+        total_return_pct = ((portfolio_value - INITIAL_CAPITAL) / INITIAL_CAPITAL) * 100
+        return {
+            'portfolio_value': round(portfolio_value, 2),
+            'cash': round(cash, 2),
+            'holdings_value': round(total_holdings_value, 2),
+            'total_return_pct': round(total_return_pct, 4),
+            'realized_pnl': round(total_realized_pnl, 2),
+            'holdings_json': json_codec.dumps(holdings_snapshot),
+        }
 
     # ------------------------------------------------------------------
     # Helpers for time-aware snapshot reconstruction
@@ -512,27 +786,43 @@ class TrackingService:
         ).order_by(TrackingTransaction.date.asc(), TrackingTransaction.id.asc()).all()
 
         # Reconstruct holdings by replaying transactions
-        holdings_map = {}  # symbol -> {symbol, name, buy_price, buy_date, cost_amount}
+        holdings_map = {}  # symbol -> {symbol, name, buy_price, buy_date, cost_amount, shares}
         sell_txns = []
 
         for tx in txns:
-            if tx.action == 'BUY':
-                holdings_map[tx.symbol] = {
-                    'symbol': tx.symbol,
-                    'name': tx.name or tx.symbol,
-                    'buy_price': tx.price,
-                    'buy_date': tx.date.strftime('%Y-%m-%d'),
-                    'cost_amount': tx.get_cost_amount(),
-                }
-            elif tx.action == 'SELL':
-                holdings_map.pop(tx.symbol, None)
+            self._replay_transaction(holdings_map, tx)
+            if tx.action == 'SELL':
                 sell_txns.append(tx)
 
         return list(holdings_map.values()), sell_txns
 
+    @staticmethod
+    def _replay_transaction(holdings_map: Dict[str, Dict], tx) -> tuple:
+        """
+        Apply one BUY/SELL transaction to holdings_map (symbol -> holding dict).
+        Returns (cash_delta, realized_pnl_delta), matching _calculate_cash.
+        """
+        if tx.action == 'BUY':
+            cost = tx.get_cost_amount()
+            holdings_map[tx.symbol] = {
+                'symbol': tx.symbol,
+                'name': tx.name or tx.symbol,
+                'buy_price': tx.price,
+                'buy_date': tx.date.strftime('%Y-%m-%d'),
+                'cost_amount': cost,
+                'shares': tx.get_shares(),
+            }
+            return -cost, 0.0
+        if tx.action == 'SELL':
+            holdings_map.pop(tx.symbol, None)
+            if tx.buy_price and tx.buy_price > 0:
+                sell_value = tx.get_shares() * tx.price
+                return sell_value, sell_value - tx.get_cost_amount()
+        return 0.0, 0.0
+
     def _calculate_cash(self, as_of_date: date = None) -> tuple:
         """
-        Calculate cash balance by replaying BUY/SELL transactions (flow-based).
+        Calculate cash balance from BUY/SELL transaction flows (flow-based).
         This avoids the bug where `num_holdings * PER_STOCK_ALLOCATION` assumes
         every position costs exactly PER_STOCK_ALLOCATION, ignoring that a
         replacement stock is funded from the actual sell proceeds (which may
@@ -545,31 +835,61 @@ class TrackingService:
         Returns:
             (cash, total_sell_returns, total_realized_pnl)
         """
-        query = TrackingTransaction.query
-        if as_of_date is not None:
-            query = query.filter(TrackingTransaction.date <= as_of_date)
-        txns = query.order_by(TrackingTransaction.date.asc(), TrackingTransaction.id.asc()).all()
-
-        cash = INITIAL_CAPITAL
-        total_sell_returns = 0.0
-        total_realized_pnl = 0.0
-
-        for tx in txns:
-            if tx.action == 'BUY':
-                cost = tx.get_cost_amount()
-                cash -= cost
-            elif tx.action == 'SELL':
-                if tx.buy_price and tx.buy_price > 0:
-                    # The cost_amount on a SELL tx records the original cost of the position
-                    original_cost = tx.get_cost_amount()
-                    shares = original_cost / tx.buy_price
-                    sell_value = shares * tx.price
-                    cash += sell_value
-                    total_sell_returns += sell_value
-                    total_realized_pnl += sell_value - original_cost
+        # Dated (snapshot) totals are computed once per snapshot, so only the running total is cached
+        if as_of_date is None:
+            # Other processes (web workers, the scheduler) also write transactions, so the cached totals
+            # are checked against (row count, max id), which identifies the append-only data they came from
+            count, max_id = db.session.query(
+                func.count(TrackingTransaction.id), func.max(TrackingTransaction.id)
+            ).one()
+            totals = None
+            if self._cash_totals is not None:
+                cached_count, cached_max_id, cached_totals = self._cash_totals
+                if (cached_count, cached_max_id) == (count, max_id):
+                    totals = cached_totals
+                elif cached_max_id is not None:
+                    # Only sum rows appended since the cached result; a full pass is needed if any row disappeared
+                    new_rows, *delta = self._cash_flow_sums(after_id=cached_max_id)
+                    if cached_count + new_rows == count:
+                        totals = tuple(a + b for a, b in zip(cached_totals, delta))
+            if totals is None:
+                totals = tuple(self._cash_flow_sums()[1:])
+            self._cash_totals = (count, max_id, totals)
+        else:
+            totals = tuple(self._cash_flow_sums(as_of_date)[1:])
 
+        total_buy_cost, total_sell_returns, total_realized_pnl = totals
+        cash = INITIAL_CAPITAL - total_buy_cost + total_sell_returns
         return cash, total_sell_returns, total_realized_pnl
 
+    @staticmethod
+    def _cash_flow_sums(as_of_date: date = None, after_id: int = None) -> tuple:
+        """
+        Aggregate transaction cash flows in SQL: (rows scanned, BUY cost, SELL proceeds, realized P&L).
+        Only rows with id > after_id are aggregated when it is given.
+        """
+        # cost_amount on a SELL tx records the original cost of the position (NULL = legacy PER_STOCK_ALLOCATION).
+        cost = func.coalesce(TrackingTransaction.cost_amount, PER_STOCK_ALLOCATION)
+        buy_conds = [TrackingTransaction.action == 'BUY']
+        sell_conds = [TrackingTransaction.action == 'SELL', TrackingTransaction.buy_price > 0]
+        if as_of_date is not None:
+            buy_conds.append(TrackingTransaction.date <= as_of_date)
+            sell_conds.append(TrackingTransaction.date <= as_of_date)
+        is_buy = and_(*buy_conds)
+        is_sell = and_(*sell_conds)
+        shares = func.coalesce(TrackingTransaction.shares, cost / TrackingTransaction.buy_price)
+        sell_value = shares * TrackingTransaction.price
+        query = db.session.query(
+            func.count(TrackingTransaction.id),
+            func.coalesce(func.sum(case((is_buy, cost), else_=0)), 0),
+            func.coalesce(func.sum(case((is_sell, sell_value), else_=0)), 0),
+            func.coalesce(func.sum(case((is_sell, sell_value - cost), else_=0)), 0),
+        )
+        if after_id is not None:
+            query = query.filter(TrackingTransaction.id > after_id)
+        row_count, total_buy_cost, total_sell_returns, total_realized_pnl = query.one()
+        return row_count, float(total_buy_cost), float(total_sell_returns), float(total_realized_pnl)
+
     def _get_historical_prices(self, symbols: List[str], target_date: date) -> Dict[str, float]:
         """
         Fetch the closing price for each symbol on *target_date*.
@@ -593,16 +913,16 @@ class TrackingService:
                 )
                 if hist is not None and not hist.empty:
                     # Try exact date first, then fall back to last available
-                    if target_str in hist.index.strftime('%Y-%m-%d'):
-                        idx = list(hist.index.strftime('%Y-%m-%d')).index(target_str)
-                        result[sym] = float(hist['Close'].iloc[idx])
+                    matches = (hist.index.strftime('%Y-%m-%d') == target_str).nonzero()[0]
+                    if matches.size:
+                        result[sym] = float(hist['Close'].iloc[matches[0]])
                     else:
                         # Use the last available close before or on target_date
                         result[sym] = float(hist['Close'].iloc[-1])
                 else:
-                    print(f"[Snapshot] No price data for {sym} around {target_str}")
+                    logger.warning("[Snapshot] No price data for %s around %s", sym, target_str)
             except Exception as e:
-                print(f"[Snapshot] Error fetching price for {sym} on {target_str}: {e}")
+                logger.error("[Snapshot] Error fetching price for %s on %s: %s", sym, target_str, e)
         return result
 
     def _bulk_fetch_historical_prices(self, symbols: List[str],
@@ -624,11 +944,9 @@ class TrackingService:
                     start=start_str, end=end_str, auto_adjust=True
                 )
                 if hist is not None and not hist.empty:
-                    for idx, row in hist.iterrows():
-                        d = idx.strftime('%Y-%m-%d')
-                        result[sym][d] = float(row['Close'])
+                    result[sym] = dict(zip(hist.index.strftime('%Y-%m-%d'), hist['Close'].tolist()))
             except Exception as e:
-                print(f"[Backfill] Error fetching history for {sym}: {e}")
+                logger.error("[Backfill] Error fetching history for %s: %s", sym, e)
         return result
 
     # ------------------------------------------------------------------
@@ -650,68 +968,20 @@ class TrackingService:
             TrackingDecisionLog.has_changes.isnot(None)
         ).first()
         if existing_log:
-            print(f"ℹ️  [Cron] Decision already exists for {today} (id={existing_log.id}), skipping duplicate run.")
+            logger.info("ℹ️  [Cron] Decision already exists for %s (id=%s), skipping duplicate run.", today, existing_log.id)
             return existing_log.to_dict()
 
-        # Get current portfolio state
-        holdings = TrackingStock.query.all()
-        holdings_info = []
-        for h in holdings:
-            price = h.current_price or h.buy_price
-            cost = h.get_cost_amount()
-            shares = cost / h.buy_price
-            ret_pct = ((price - h.buy_price) / h.buy_price) * 100
-            holdings_info.append({
-                'symbol': h.symbol,
-                'name': h.name or h.symbol,
-                'buy_price': h.buy_price,
-                'buy_date': h.buy_date.strftime('%Y-%m-%d'),
-                'current_price': price,
-                'cost_amount': round(cost, 2),
-                'return_pct': round(ret_pct, 2),
-                'shares': round(shares, 4),
-                'value': round(shares * price, 2)
-            })
-
-        # Get recent transaction history
-        recent_txns = TrackingTransaction.query.order_by(
-            TrackingTransaction.date.desc()
-        ).limit(20).all()
-        txn_history = [t.to_dict() for t in recent_txns]
-
-        # Calculate portfolio state using flow-based cash method
-        cash, total_sell_returns, total_realized_pnl = self._calculate_cash()
-        num_current = len(holdings)
-        available_slots = MAX_HOLDINGS - num_current
-        holdings_value = sum(
-            (h.get_cost_amount() / h.buy_price) * (h.current_price or h.buy_price)
-            for h in holdings
-        )
-        portfolio_value = cash + holdings_value
-
-        # Build decision retrospective from recent decision logs
-        decision_retrospective = self._build_decision_retrospective()
-
-        # Build the AI prompt
-        prompt_result = self._build_decision_prompt(
-            holdings_info=holdings_info,
-            txn_history=txn_history,
-            portfolio_value=portfolio_value,
-            cash=cash,
-            total_realized_pnl=total_realized_pnl,
-            available_slots=available_slots,
-            num_current=num_current,
-            today=today,
-            decision_retrospective=decision_retrospective
-        )
-
-        # Run AI agent with higher iteration limit for deep analysis
+        # Check model support first, so an unusable model does not pay for building the portfolio context
         start_time = time.time()
         try:
             supports, config, adapter = self.ai_analyzer._check_agent_support(model_name)
             if not supports:
                 raise ValueError(f"Model {model_name} does not support tool calling")
 
+            prompt_result = self._build_decision_context(today)
+
+            # Run AI agent with higher iteration limit for deep analysis
+            start_time = time.time()
             tool_executor = self.ai_analyzer._create_tool_executor(
                 asset_type='STOCK',
                 provider=config.get('provider')
@@ -728,7 +998,7 @@ class TrackingService:
             elapsed_seconds = time.time() - start_time
 
         except Exception as e:
-            print(f"[TrackingDecision] ❌ Failed: {e}")
+            logger.error("[TrackingDecision] ❌ Failed: %s", e)
             # Log the failure
             log = TrackingDecisionLog(
                 date=today,
@@ -789,7 +1059,7 @@ class TrackingService:
                 # Fresh buy from remaining cash
                 buy_cost = min(PER_STOCK_ALLOCATION, current_cash)
                 if buy_cost <= 0:
-                    print(f"[Tracking] No cash available for BUY {symbol}, skipping")
+                    logger.warning("[Tracking] No cash available for BUY %s, skipping", symbol)
                     continue
 
             success = self._execute_buy(symbol, name, reason, today, cost_amount=buy_cost)
@@ -819,10 +1089,10 @@ class TrackingService:
             model_name=model_name,
             has_changes=len(executed_actions) > 0,
             summary=summary,
-            actions_json=json.dumps(executed_actions),
+            actions_json=json_codec.dumps(executed_actions),
             raw_response=text[:10000] if text else None,
             elapsed_seconds=elapsed_seconds,
-            report_json=json.dumps(report_data, ensure_ascii=False) if report_data else None,
+            report_json=json_codec.dumps(report_data) if report_data else None,
             market_regime=market_regime[:20] if market_regime else None,
             confidence_level=confidence_level[:20] if confidence_level else None
         )
@@ -830,9 +1100,9 @@ class TrackingService:
 
         # Refresh all prices before snapshot (decision may have triggered rate limits)
         db.session.commit()
-        print("[Tracking] Refreshing all stock prices before snapshot...")
+        logger.info("[Tracking] Refreshing all stock prices before snapshot...")
         refresh_result = self.refresh_prices()
-        print(f"[Tracking] Price refresh: updated {refresh_result['updated']}/{refresh_result['total']} stocks")
+        logger.info("[Tracking] Price refresh: updated %s/%s stocks", refresh_result['updated'], refresh_result['total'])
         self.take_daily_snapshot(today)
 
         return log.to_dict()
@@ -853,24 +1123,27 @@ class TrackingService:
         # Check if already holding
         existing = TrackingStock.query.filter_by(symbol=symbol).first()
         if existing:
-            print(f"[Tracking] Already holding {symbol}, skipping BUY")
+            logger.warning("[Tracking] Already holding %s, skipping BUY", symbol)
             return False
 
         # Check max holdings
         current_count = TrackingStock.query.count()
         if current_count >= MAX_HOLDINGS:
-            print(f"[Tracking] Max holdings ({MAX_HOLDINGS}) reached, skipping BUY {symbol}")
+            logger.warning("[Tracking] Max holdings (%s) reached, skipping BUY %s", MAX_HOLDINGS, symbol)
             return False
 
         # Get current price
-        price = DataProvider.get_current_price(symbol)
+        price = self._current_price(symbol)
         if price is None:
-            print(f"[Tracking] Cannot get price for {symbol}, skipping BUY")
+            logger.warning("[Tracking] Cannot get price for %s, skipping BUY", symbol)
             return False
 
         # Fetch sector and industry from yfinance
         sector, industry = self._fetch_sector_industry(symbol)
 
+        cost_amount = round(cost_amount, 2)
+        shares = cost_amount / price
+
         # Add to tracking list
         stock = TrackingStock(
             symbol=symbol,
@@ -878,7 +1151,8 @@ class TrackingService:
             buy_price=price,
             buy_date=trade_date,
             current_price=price,
-            cost_amount=round(cost_amount, 2),
+            cost_amount=cost_amount,
+            shares=shares,
             sector=sector,
             industry=industry,
             reason=reason
@@ -893,12 +1167,13 @@ class TrackingService:
             price=price,
             date=trade_date,
             reason=reason,
-            cost_amount=round(cost_amount, 2)
+            cost_amount=cost_amount,
+            shares=shares
         )
         db.session.add(txn)
         db.session.flush()
 
-        print(f"[Tracking] ✅ BUY {symbol} @ ${price:.2f} (invested: ${cost_amount:,.2f})")
+        logger.info("[Tracking] ✅ BUY %s @ $%.2f (invested: $%.2f)", symbol, price, cost_amount)
         return True
 
     def _execute_sell(self, symbol: str, reason: str, trade_date: date) -> Optional[float]:
@@ -911,17 +1186,17 @@ class TrackingService:
         """
         stock = TrackingStock.query.filter_by(symbol=symbol).first()
         if not stock:
-            print(f"[Tracking] Not holding {symbol}, skipping SELL")
+            logger.warning("[Tracking] Not holding %s, skipping SELL", symbol)
             return None
 
         # Get current price for sell
-        price = DataProvider.get_current_price(symbol)
+        price = self._current_price(symbol)
         if price is None:
             price = stock.current_price or stock.buy_price
 
         # Calculate realized return and actual proceeds
         original_cost = stock.get_cost_amount()
-        shares = original_cost / stock.buy_price
+        shares = stock.get_shares()
         sell_value = shares * price
         realized_pct = ((price - stock.buy_price) / stock.buy_price) * 100
 
@@ -935,7 +1210,8 @@ class TrackingService:
             reason=reason,
             buy_price=stock.buy_price,
             realized_pct=round(realized_pct, 2),
-            cost_amount=round(original_cost, 2)
+            cost_amount=round(original_cost, 2),
+            shares=shares
         )
         db.session.add(txn)
 
@@ -943,27 +1219,68 @@ class TrackingService:
         db.session.delete(stock)
         db.session.flush()
 
-        print(f"[Tracking] ✅ SELL {symbol} @ ${price:.2f} (return: {realized_pct:+.2f}%, proceeds: ${sell_value:,.2f})")
+        logger.info("[Tracking] ✅ SELL %s @ $%.2f (return: %+.2f%%, proceeds: $%.2f)", symbol, price, realized_pct, sell_value)
         return sell_value
 
+    def _build_decision_context(self, today: date):
+        """Portfolio state, recent transactions and retrospective rendered into the daily decision prompt."""
+        # Get current portfolio state
+        state = self._load_portfolio_state()
+        holdings_info = state.holdings
+
+        # Get recent transaction history
+        txn_history = self.get_transaction_history(limit=20)
+
+        cash = state.cash
+        total_realized_pnl = state.realized_pnl
+        num_current = state.num_holdings
+        available_slots = MAX_HOLDINGS - num_current
+        portfolio_value = state.portfolio_value
+
+        # Build decision retrospective from recent decision logs
+        decision_retrospective = self._build_decision_retrospective()
+
+        # Build the AI prompt
+        prompt_result = self._build_decision_prompt(
+            holdings_info=holdings_info,
+            txn_history=txn_history,
+            portfolio_value=portfolio_value,
+            cash=cash,
+            total_realized_pnl=total_realized_pnl,
+            available_slots=available_slots,
+            num_current=num_current,
+            today=today,
+            decision_retrospective=decision_retrospective
+        )
+        return prompt_result
+
     def _build_decision_retrospective(self) -> str:
         """
         Build a retrospective of recent decisions with quantified accuracy feedback.
         Shows what was decided, what actually happened, and accuracy scores
         so the AI can calibrate its future decisions.
         """
-        recent_logs = TrackingDecisionLog.query.order_by(
-            TrackingDecisionLog.date.desc()
-        ).limit(5).all()
+        # Only the columns rendered below; raw_response / report_json can be large
+        recent_logs = db.session.query(
+            TrackingDecisionLog.date, TrackingDecisionLog.market_regime, TrackingDecisionLog.confidence_level,
+            TrackingDecisionLog.accuracy_score, TrackingDecisionLog.has_changes, TrackingDecisionLog.actions_json
+        ).order_by(TrackingDecisionLog.date.desc()).limit(5).all()
 
         if not recent_logs:
             return ""
 
         # Get current holdings for price comparison
-        current_holdings = {s.symbol: s for s in TrackingStock.query.all()}
+        current_holdings = {
+            s.symbol: s for s in db.session.query(
+                TrackingStock.symbol, TrackingStock.buy_price, TrackingStock.current_price
+            )
+        }
 
         # Get recent sell transactions for outcome tracking
-        recent_sells = TrackingTransaction.query.filter_by(action='SELL').order_by(
+        recent_sells = db.session.query(
+            TrackingTransaction.symbol, TrackingTransaction.date, TrackingTransaction.price,
+            TrackingTransaction.buy_price, TrackingTransaction.realized_pct
+        ).filter(TrackingTransaction.action == 'SELL').order_by(
             TrackingTransaction.date.desc()
         ).limit(10).all()
         sell_outcomes = {}
@@ -976,13 +1293,12 @@ class TrackingService:
             }
 
         # Compute aggregate accuracy stats from evaluated logs
-        evaluated_logs = TrackingDecisionLog.query.filter(
+        scores = [row.accuracy_score for row in db.session.query(TrackingDecisionLog.accuracy_score).filter(
             TrackingDecisionLog.accuracy_score.isnot(None)
-        ).order_by(TrackingDecisionLog.date.desc()).limit(20).all()
+        ).order_by(TrackingDecisionLog.date.desc()).limit(20)]
 
         accuracy_stats = ""
-        if evaluated_logs:
-            scores = [l.accuracy_score for l in evaluated_logs]
+        if scores:
             avg_score = round(sum(scores) / len(scores), 1)
             recent_5 = scores[:5]
             recent_avg = round(sum(recent_5) / len(recent_5), 1) if recent_5 else 0
@@ -1000,13 +1316,7 @@ class TrackingService:
             acc_str = f", accuracy: {log.accuracy_score:.0f}/100" if log.accuracy_score is not None else ""
             entry = f"- **{log.date.strftime('%Y-%m-%d')}** (regime: {log.market_regime or 'N/A'}, confidence: {log.confidence_level or 'N/A'}{acc_str}):"
             if log.has_changes:
-                actions = []
-                if log.actions_json:
-                    try:
-                        actions = json.loads(log.actions_json)
-                    except Exception:
-                        pass
-                for act in actions:
+                for act in self._parse_json_column(log.actions_json) or []:
                     symbol = act.get('symbol', '?')
                     action_type = act.get('action', '?')
                     if action_type == 'BUY' and symbol in current_holdings:
@@ -1030,12 +1340,13 @@ class TrackingService:
         """Build the AI prompt for daily deep-research decision making."""
         current_date = today.strftime('%Y-%m-%d')
 
-        holdings_text = "No current holdings." if not holdings_info else json.dumps(holdings_info, indent=2)
-        txn_text = "No recent transactions." if not txn_history else json.dumps(txn_history[:10], indent=2)
+        # Compact JSON: indentation only costs prompt tokens
+        holdings_text = "No current holdings." if not holdings_info else json_codec.dumps(holdings_info)
+        txn_text = "No recent transactions." if not txn_history else json_codec.dumps(txn_history[:10])
 
         from app.services.ai_analyzer import INVESTMENT_PHILOSOPHY
 
-        tool_descriptions = self.ai_analyzer._get_tool_descriptions_text()
+        tool_descriptions = self.ai_analyzer._tool_descriptions_text
 
         # Build sector distribution text for concentration awareness
         sector_distribution = self._build_sector_distribution(holdings_info)
@@ -1232,7 +1543,7 @@ Return a SINGLE valid JSON object with this structure:
         # Determine the earliest meaningful date from existing data
         earliest_txn = TrackingTransaction.query.order_by(TrackingTransaction.date.asc()).first()
         if not earliest_txn:
-            print("No transactions found. Nothing to backfill.")
+            logger.info("No transactions found. Nothing to backfill.")
             return 0
         earliest_data_date = earliest_txn.date
 
@@ -1243,36 +1554,54 @@ Return a SINGLE valid JSON object with this structure:
 
         # Never backfill before the earliest transaction
         if start < earliest_data_date:
-            print(f"Clamping backfill start from {start} to {earliest_data_date} (earliest transaction)")
+            logger.info("Clamping backfill start from %s to %s (earliest transaction)", start, earliest_data_date)
             start = earliest_data_date
 
         end = _us_eastern_today()
 
+        # All transactions, replayed in order while walking the dates below
+        all_txns = TrackingTransaction.query.order_by(
+            TrackingTransaction.date.asc(), TrackingTransaction.id.asc()
+        ).all()
+
         # Collect ALL symbols that appear in any transaction so we can bulk-fetch prices
-        all_txns = TrackingTransaction.query.all()
         all_symbols = list({tx.symbol for tx in all_txns})
         # Also include currently held stocks (in case they have no sell txn yet)
-        for s in TrackingStock.query.all():
-            if s.symbol not in all_symbols:
-                all_symbols.append(s.symbol)
+        for (symbol,) in db.session.query(TrackingStock.symbol):
+            if symbol not in all_symbols:
+                all_symbols.append(symbol)
 
-        print(f"[Backfill] Fetching historical prices for {len(all_symbols)} symbols "
-              f"from {start} to {end} ...")
+        logger.info("[Backfill] Fetching historical prices for %s symbols from %s to %s ...",
+                    len(all_symbols), start, end)
         price_cache = self._bulk_fetch_historical_prices(all_symbols, start, end)
 
-        current = start
+        holdings_map = {}
+        cash = INITIAL_CAPITAL
+        total_realized_pnl = 0.0
+        next_txn = 0
+
         count = 0
-        while current <= end:
-            # Skip weekends
-            if current.weekday() < 5:
-                try:
-                    self.take_daily_snapshot(current, price_cache=price_cache)
-                    count += 1
-                except Exception as e:
-                    print(f"Error backfilling snapshot for {current}: {e}")
-            current += timedelta(days=1)
+        # Weekdays only (weekends never have snapshots)
+        for current in pd.bdate_range(start, end).date:
+            # Apply every transaction up to and including this date (weekend trades included)
+            while next_txn < len(all_txns) and all_txns[next_txn].date <= current:
+                cash_delta, pnl_delta = self._replay_transaction(holdings_map, all_txns[next_txn])
+                cash += cash_delta
+                total_realized_pnl += pnl_delta
+                next_txn += 1
+
+            try:
+                holdings = [dict(h) for h in holdings_map.values()]
+                self._apply_snapshot_prices(holdings, current, price_cache)
+                fields = self._snapshot_fields(holdings, cash, total_realized_pnl)
+                self._upsert_snapshot(current, fields)
+                count += 1
+            except Exception as e:
+                logger.error("Error backfilling snapshot for %s: %s", current, e)
 
-        print(f"[Backfill] Done. Processed {count} trading days.")
+        # One commit for all upserted snapshots
+        db.session.commit()
+        logger.info("[Backfill] Done. Processed %s trading days.", count)
         return count
 
     # ------------------------------------------------------------------
@@ -1284,7 +1613,7 @@ Return a SINGLE valid JSON object with this structure:
         Build a human-readable sector distribution summary from current holdings.
         Uses sector/industry data stored in TrackingStock model.
         """
-        stocks = TrackingStock.query.all()
+        stocks = db.session.query(TrackingStock.symbol, TrackingStock.sector).all()
         if not stocks:
             return "No holdings — portfolio is 100% cash."
 
@@ -1340,15 +1669,15 @@ Return a SINGLE valid JSON object with this structure:
             try:
                 details = self._evaluate_single_decision(log, lookback_days)
                 log.accuracy_score = details.get('overall_score', 50.0)
-                log.accuracy_details = json.dumps(details, ensure_ascii=False)
+                log.accuracy_details = json_codec.dumps(details)
                 log.accuracy_evaluated_at = datetime.utcnow()
                 evaluated_count += 1
             except Exception as e:
-                print(f"[Eval] Error evaluating decision {log.date}: {e}")
+                logger.error("[Eval] Error evaluating decision %s: %s", log.date, e)
                 continue
 
         db.session.commit()
-        print(f"[Eval] Evaluated {evaluated_count} past decisions.")
+        logger.info("[Eval] Evaluated %s past decisions.", evaluated_count)
         return evaluated_count
 
     def _evaluate_single_decision(self, log: 'TrackingDecisionLog',
@@ -1367,7 +1696,7 @@ Return a SINGLE valid JSON object with this structure:
         actions = []
         if log.actions_json:
             try:
-                actions = json.loads(log.actions_json)
+                actions = json_codec.loads(log.actions_json)
             except Exception:
                 pass
 
@@ -1443,10 +1772,10 @@ Return a SINGLE valid JSON object with this structure:
         # If no actions were taken (HOLD), evaluate based on portfolio trend
         if not actions or not action_scores:
             # HOLD is neutral — score based on whether the portfolio held up
-            snap_before = TrackingDailySnapshot.query.filter(
+            snap_before = db.session.query(TrackingDailySnapshot.portfolio_value).filter(
                 TrackingDailySnapshot.date <= decision_date
             ).order_by(TrackingDailySnapshot.date.desc()).first()
-            snap_after = TrackingDailySnapshot.query.filter(
+            snap_after = db.session.query(TrackingDailySnapshot.portfolio_value).filter(
                 TrackingDailySnapshot.date >= eval_date
             ).order_by(TrackingDailySnapshot.date.asc()).first()
 
@@ -1488,7 +1817,7 @@ Return a SINGLE valid JSON object with this structure:
         ).all()
 
         if not stocks:
-            print("[Backfill] All stocks already have sector data.")
+            logger.info("[Backfill] All stocks already have sector data.")
             return 0
 
         count = 0
@@ -1498,11 +1827,11 @@ Return a SINGLE valid JSON object with this structure:
                 s.sector = sector
                 s.industry = industry
                 count += 1
-                print(f"  {s.symbol}: {sector} / {industry}")
+                logger.info("  %s: %s / %s", s.symbol, sector, industry)
             time.sleep(1)  # Rate limit
 
         db.session.commit()
-        print(f"[Backfill] Updated sector data for {count}/{len(stocks)} stocks.")
+        logger.info("[Backfill] Updated sector data for %s/%s stocks.", count, len(stocks))
         return count
 
 
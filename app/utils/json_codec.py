@@ -0,0 +1,48 @@
+import base64
+import json
+import zlib
+import orjson
+
+# Stored values with this prefix are zlib-compressed JSON (base64 so they still fit TEXT columns).
+# Anything else is legacy plain JSON and is read as-is.
+COMPRESSED_PREFIX = 'zlib:'
+COMPRESS_MIN_CHARS = 4096  # Small payloads are not worth compressing
+COMPRESS_LEVEL = 6
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(obj):
+    """Serialize obj to a compact JSON str with orjson; falls back to json.dumps for types orjson rejects."""
+    try:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode('utf-8')
+    except TypeError:
+        return json.dumps(obj)
+
+
+def loads(value):
+    """Parse JSON from str or bytes with orjson. Raises ValueError (json.JSONDecodeError) on invalid input."""
+    return orjson.loads(value)
+
+
+def compress_text(text):
+    """Compress an already serialized JSON str when large enough to matter (readable by loads_compressed)."""
+    if len(text) < COMPRESS_MIN_CHARS:
+        return text
+    packed = zlib.compress(text.encode('utf-8'), COMPRESS_LEVEL)
+    return COMPRESSED_PREFIX + base64.b64encode(packed).decode('ascii')
+
+
+def dumps_compressed(obj):
+    """Serialize obj to JSON, compressing it when large enough to matter."""
+    return compress_text(dumps(obj))
+
+
+def loads_compressed(value):
+    """Inverse of dumps_compressed; also accepts plain JSON. Raises ValueError on corrupt data."""
+    if value.startswith(COMPRESSED_PREFIX):
+        try:
+            value = zlib.decompress(base64.b64decode(value[len(COMPRESSED_PREFIX):]))
+        except zlib.error as e:
+            raise ValueError(f"Corrupt compressed JSON: {e}")
+    return orjson.loads(value)
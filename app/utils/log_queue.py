@@ -0,0 +1,44 @@
+import atexit
+import logging
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Records from all loggers created here go through one in-memory queue; a single listener thread writes them out,
+# so background workers never block on the stdout lock.
+_LOG_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+
+_log_queue = queue.Queue(-1)
+_queue_handler = QueueHandler(_log_queue)
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _start_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter(_LOG_FORMAT))
+        _listener = QueueListener(_log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        # Flush queued records on interpreter exit
+        atexit.register(_listener.stop)
+
+
+def get_logger(name):
+    """Return a logger whose records are written by the shared background listener."""
+    _start_listener()
+    logger = logging.getLogger(name)
+    if _queue_handler not in logger.handlers:
+        logger.addHandler(_queue_handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def format_fields(fields):
+    """Render key/value pairs as indented lines to append to a single multi-line record."""
+    return ''.join(f"\n  {key}: {value}" for key, value in fields.items())
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 def calculate_indicators(data_list):
@@ -27,3 +28,155 @@ def calculate_indicators(data_list):
     # Convert back to list of dicts, keeping original fields plus indicators
     return df.to_dict('records')
 
+def rolling_mean(values, window):
+    """
+    Trailing moving average over a 1-D array, same length as the input with
+    NaN for the first window-1 entries (like pandas rolling(window).mean()).
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.size, np.nan)
+    if values.size >= window:
+        # Each window is summed on its own, so flat stretches give exactly equal averages
+        out[window - 1:] = np.lib.stride_tricks.sliding_window_view(values, window).mean(axis=1)
+    return out
+
+def wilder_rsi(close, period=14):
+    """
+    Wilder's RSI over a 1-D close series, same length as the input with NaN
+    until the first full period. The first average gain/loss is the simple
+    mean of `period` deltas; later ones use Wilder smoothing
+    avg = (prev * (period - 1) + current) / period.
+    """
+    close = np.asarray(close, dtype=float)
+    rsi = np.full(close.size, np.nan)
+    if close.size <= period:
+        return rsi
+
+    delta = np.diff(close)
+    gains = np.where(delta > 0, delta, 0.0)
+    losses = np.where(delta < 0, -delta, 0.0)
+    avg_gain = np.empty(delta.size - period + 1)
+    avg_loss = np.empty(delta.size - period + 1)
+    avg_gain[0] = gains[:period].mean()
+    avg_loss[0] = losses[:period].mean()
+    # The smoothing is a first-order recurrence; one pass over plain floats
+    g, l = avg_gain[0], avg_loss[0]
+    for k, (gain, loss) in enumerate(zip(gains[period:].tolist(), losses[period:].tolist()), start=1):
+        g = (g * (period - 1) + gain) / period
+        l = (l * (period - 1) + loss) / period
+        avg_gain[k] = g
+        avg_loss[k] = l
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi[period:] = 100 - (100 / (1 + avg_gain / avg_loss))
+    return rsi
+
+def pair_signal_trades(signal_types):
+    """
+    Pair chronologically ordered BUY/SELL signals into round-trip trades,
+    holding at most one position at a time (extra BUYs while holding and
+    SELLs while flat are ignored; other signal types are skipped).
+
+    Returns (buy_idx, sell_idx, open_buy_idx): index arrays into
+    signal_types for each closed trade, plus the index of the still-open
+    BUY (or None).
+    """
+    types = np.asarray(signal_types)
+    empty = np.empty(0, dtype=np.intp)
+    idx = np.flatnonzero((types == 'BUY') | (types == 'SELL'))
+    if idx.size == 0:
+        return empty, empty, None
+
+    # Only the first signal of each BUY/SELL run changes the position state
+    is_buy = types[idx] == 'BUY'
+    run_start = np.ones(idx.size, dtype=bool)
+    run_start[1:] = is_buy[1:] != is_buy[:-1]
+    starts = idx[run_start]
+    if not is_buy[0]:
+        starts = starts[1:]  # Leading SELLs have no position to close
+
+    # Runs now strictly alternate BUY, SELL, BUY, ...
+    buy_idx = starts[0::2]
+    sell_idx = starts[1::2]
+    open_buy_idx = int(buy_idx[-1]) if buy_idx.size > sell_idx.size else None
+    return buy_idx[:sell_idx.size], sell_idx, open_buy_idx
+
+def fifo_match_lots(quantities, is_buy, eps=1e-6):
+    """
+    FIFO lot matching for a chronologically ordered BUY/SELL ledger.
+    A SELL consumes the oldest open BUY lots first; any quantity beyond the
+    open position is ignored (no shorting).
+
+    Returns (buy_pos, sell_pos, open_buy_pos): buy_pos/sell_pos index the
+    BUY-only / SELL-only subsequences for each matched (buy lot, sell) pair,
+    in sell order; open_buy_pos lists BUY lots with quantity still open.
+    """
+    qty = np.asarray(quantities, dtype=float)
+    is_buy = np.asarray(is_buy, dtype=bool)
+    empty = np.empty(0, dtype=np.intp)
+    if qty.size == 0:
+        return empty, empty, empty
+
+    # Position after each row, reflected at zero so oversized sells cannot go short
+    raw = np.cumsum(np.where(is_buy, qty, -qty))
+    position = raw - np.minimum(np.minimum.accumulate(raw), 0.0)
+    filled = np.concatenate(([0.0], position[:-1])) - position
+    sell_filled = filled[~is_buy]
+
+    buy_qty = qty[is_buy]
+    buy_cum = np.cumsum(buy_qty)
+    sell_cum = np.cumsum(sell_filled)
+    total_sold = sell_cum[-1] if sell_cum.size else 0.0
+
+    # Sold quantity laid out on one axis: every segment between consecutive
+    # lot/sell boundaries belongs to exactly one (buy lot, sell) pair
+    bounds = np.union1d(np.concatenate(([0.0], buy_cum, sell_cum)), [total_sold])
+    bounds = bounds[bounds <= total_sold]
+    starts, ends = bounds[:-1], bounds[1:]
+    keep = (ends - starts) > eps
+    mids = (starts[keep] + ends[keep]) / 2
+    buy_pos = np.minimum(np.searchsorted(buy_cum, mids, side='right'), buy_cum.size - 1)
+    sell_pos = np.minimum(np.searchsorted(sell_cum, mids, side='right'), sell_cum.size - 1)
+
+    remaining = np.minimum(buy_qty, buy_cum - total_sold)
+    open_buy_pos = np.flatnonzero(remaining > eps)
+    return buy_pos, sell_pos, open_buy_pos
+
+def simulate_long_positions(close, entry_idx, exit_idx, stop_loss_pct, start=0):
+    """
+    Long-only position state machine over a price series: enter on the next
+    entry bar while flat, exit on the next exit bar or the first close below
+    the stop-loss level while holding (one position at a time).
+
+    entry_idx/exit_idx are sorted bar indices where the entry/exit rules
+    fire. Returns (buy_bars, sell_bars, open_buy_bar): bar indices of each
+    closed trade, plus the bar of the still-open entry (or None).
+    """
+    close = np.asarray(close, dtype=float)
+    entry_idx = np.asarray(entry_idx, dtype=np.intp)
+    exit_idx = np.asarray(exit_idx, dtype=np.intp)
+    n = close.size
+    buy_bars = []
+    sell_bars = []
+
+    i = start
+    while i < n:
+        # Flat: jump to the next entry bar
+        k = np.searchsorted(entry_idx, i)
+        if k == entry_idx.size:
+            break
+        buy = int(entry_idx[k])
+
+        # Holding: the stop level depends on the entry price, so scan for it per position
+        k = np.searchsorted(exit_idx, buy + 1)
+        next_exit = int(exit_idx[k]) if k < exit_idx.size else n
+        stops = np.flatnonzero(close[buy + 1:next_exit] < close[buy] * (1 - stop_loss_pct))
+        sell = buy + 1 + int(stops[0]) if stops.size else next_exit
+        if sell == n:
+            return np.array(buy_bars, dtype=np.intp), np.array(sell_bars, dtype=np.intp), buy
+
+        buy_bars.append(buy)
+        sell_bars.append(sell)
+        i = sell + 1
+
+    return np.array(buy_bars, dtype=np.intp), np.array(sell_bars, dtype=np.intp), None
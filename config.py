@@ -9,6 +9,8 @@ class Config:
         'sqlite:///' + os.path.join(basedir, 'instance', 'investpilot.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    # Large async task results are stored as compressed files here; the tasks table keeps a reference
+    TASK_RESULTS_DIR = os.environ.get('TASK_RESULTS_DIR') or os.path.join(basedir, 'instance', 'task_results')
     
     # AI Model API Keys
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
@@ -1722,6 +1722,14 @@ const showRecommendToolCalls = ref(true);  // Toggle for recommend agent trace p
             const aiSignalsAdopted = [];
             const userTradeMarks = [];
             
+            // Index trades by buy/sell date once (first match wins, same as Array.find)
+            const tradesByBuyDate = new Map();
+            const tradesBySellDate = new Map();
+            trades.forEach(t => {
+                if (!tradesByBuyDate.has(t.buy_date)) tradesByBuyDate.set(t.buy_date, t);
+                if (!tradesBySellDate.has(t.sell_date)) tradesBySellDate.set(t.sell_date, t);
+            });
+            
             // Process AI signals
             signals.forEach(sig => {
                 // Skip WAIT and HOLD - they are shown in summary only
@@ -1731,9 +1739,9 @@ const showRecommendToolCalls = ref(true);  // Toggle for recommend agent trace p
                 
                 let tradeInfo = null;
                 if (sig.type === 'BUY') {
-                    tradeInfo = trades.find(t => t.buy_date === sig.date);
+                    tradeInfo = tradesByBuyDate.get(sig.date);
                 } else if (sig.type === 'SELL') {
-                    tradeInfo = trades.find(t => t.sell_date === sig.date);
+                    tradeInfo = tradesBySellDate.get(sig.date);
                 }
                 
                 // BUY/ADD shown as green, SELL/REDUCE shown as red on chart
@@ -2595,17 +2603,38 @@ xAxis: [
             }
         };
         
+        // Last K-line payload received from a task; the server omits kline_data when the hash matches
+        const lastTaskKline = { hash: null, data: null };
+        
+        // Fetch a single task including its result (the task list omits results)
+        const fetchTask = async (taskId) => {
+            const headers = { 'X-Session-ID': sessionId.value };
+            if (lastTaskKline.hash) {
+                headers['If-None-Match'] = `"${lastTaskKline.hash}"`;
+            }
+            const res = await fetch(`/api/tasks/${taskId}`, { headers });
+            if (!res.ok) {
+                return null;
+            }
+            const task = await res.json();
+            const result = task.task_result;
+            if (result && result.kline_data_unchanged) {
+                result.kline_data = lastTaskKline.data;
+            } else if (result && result.kline_hash) {
+                lastTaskKline.hash = result.kline_hash;
+                lastTaskKline.data = result.kline_data;
+            }
+            return task;
+        };
+        
         const pollTaskUntilComplete = async (taskId, callback) => {
             const maxAttempts = 300; // 10 minutes max
             let attempts = 0;
             
             const poll = async () => {
                 try {
-                    const res = await fetch(`/api/tasks/${taskId}`, {
-                        headers: { 'X-Session-ID': sessionId.value }
-                    });
-                    if (res.ok) {
-                        const task = await res.json();
+                    const task = await fetchTask(taskId);
+                    if (task) {
                         if (task.status === 'completed') {
                             callback(task.task_result);
                             loadTasks(); // Refresh task list
@@ -2649,9 +2678,18 @@ xAxis: [
             }
         };
         
-        const showTaskResult = (task) => {
+        const showTaskResult = async (task) => {
             console.log('showTaskResult called with task:', task);
             
+            if (task.task_result === undefined) {
+                // List entries carry no result; load it on demand
+                try {
+                    task = (await fetchTask(task.task_id)) || task;
+                } catch (err) {
+                    console.error('Failed to load task result:', err);
+                }
+            }
+            
             if (!task.task_result) {
                 console.log('No task_result found');
                 return;
@@ -11,7 +11,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import create_app, db
-from app.models.analysis import AnalysisLog, StockTradeSignal, RecommendationCache, User, Account, CashFlow, Task, Portfolio, Transaction, TrackingStock, TrackingTransaction, TrackingDailySnapshot, TrackingDecisionLog
+from app.models.analysis import AnalysisLog, StockTradeSignal, RecommendationCache, User, Account, CashFlow, Task, Portfolio, Transaction, TrackingStock, TrackingTransaction, TrackingDailySnapshot, TrackingDecisionLog, BenchmarkPriceCache
 
 def _upgrade_tracking_decision_logs(inspector, db):
     """Add missing columns to tracking_decision_logs table (deep report fields)."""
@@ -33,6 +33,44 @@ def _upgrade_tracking_decision_logs(inspector, db):
     db.session.commit()
 
 
+def _upgrade_tracking_shares(inspector, db):
+    """Add the stored shares column to tracking_stocks / tracking_transactions and backfill it."""
+    # Legacy rows without cost_amount were bought with PER_STOCK_ALLOCATION (10000)
+    buy_price_exprs = {
+        'tracking_stocks': 'buy_price',
+        'tracking_transactions': "CASE WHEN action = 'BUY' THEN price ELSE buy_price END",
+    }
+    existing_tables = set(inspector.get_table_names())
+    for table, buy_price_expr in buy_price_exprs.items():
+        if table not in existing_tables:
+            continue
+        existing_columns = {col['name'] for col in inspector.get_columns(table)}
+        if 'shares' in existing_columns:
+            continue
+        print(f"  ↳ Adding column 'shares' to {table}...")
+        db.session.execute(db.text(f'ALTER TABLE {table} ADD COLUMN shares FLOAT'))
+        db.session.execute(db.text(
+            f'UPDATE {table} SET shares = COALESCE(cost_amount, 10000.0) / ({buy_price_expr}) '
+            f'WHERE ({buy_price_expr}) > 0'
+        ))
+    db.session.commit()
+
+
+def _upgrade_composite_indexes(inspector, db):
+    """Create composite indexes declared on the models but missing from existing tables."""
+    existing_tables = set(inspector.get_table_names())
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            # Single-column indexes are named differently in init_db.sql; only sync composite ones
+            if len(index.columns) > 1 and index.name not in existing_indexes:
+                print(f"  ↳ Creating index '{index.name}' on {table.name}...")
+                index.create(bind=db.engine)
+
+
 def init_database():
     """初始化数据库表（幂等性：如果表已存在则跳过）"""
     app = create_app()
@@ -46,7 +84,8 @@ def init_database():
         required_tables = [
             'users', 'accounts', 'cash_flows', 'tasks', 'analysis_logs',
             'stock_trade_signals', 'recommendation_cache', 'portfolios', 'transactions',
-            'tracking_stocks', 'tracking_transactions', 'tracking_daily_snapshots', 'tracking_decision_logs'
+            'tracking_stocks', 'tracking_transactions', 'tracking_daily_snapshots', 'tracking_decision_logs',
+            'benchmark_price_cache'
         ]
         missing_tables = [t for t in required_tables if t not in existing_tables]
         
@@ -59,6 +98,8 @@ def init_database():
         
         # Auto-upgrade: add missing columns to existing tables (SQLite does not do this via create_all)
         _upgrade_tracking_decision_logs(inspector, db)
+        _upgrade_tracking_shares(inspector, db)
+        _upgrade_composite_indexes(inspector, db)
         
         # 显示已创建的表
         print("\nExisting tables:")
@@ -75,6 +116,7 @@ def init_database():
         print("- tracking_transactions")
         print("- tracking_daily_snapshots")
         print("- tracking_decision_logs")
+        print("- benchmark_price_cache")
         
         # 显示统计信息
         try:
@@ -91,6 +133,7 @@ def init_database():
             tracking_txn_count = TrackingTransaction.query.count()
             tracking_snapshot_count = TrackingDailySnapshot.query.count()
             tracking_decision_count = TrackingDecisionLog.query.count()
+            benchmark_price_count = BenchmarkPriceCache.query.count()
             
             print(f"\nCurrent data:")
             print(f"- Analysis logs: {analysis_count}")
@@ -106,6 +149,7 @@ def init_database():
             print(f"- Tracking transactions: {tracking_txn_count}")
             print(f"- Tracking snapshots: {tracking_snapshot_count}")
             print(f"- Tracking decisions: {tracking_decision_count}")
+            print(f"- Benchmark prices: {benchmark_price_count}")
         except Exception as e:
             print(f"\nWarning: Could not query statistics: {e}")
 
@@ -122,7 +122,7 @@ CREATE TABLE IF NOT EXISTS `tasks` (
   `user_id` INT NOT NULL COMMENT 'User ID (FK)',
   `task_type` VARCHAR(50) NOT NULL COMMENT 'Task type',
   `status` VARCHAR(20) NOT NULL DEFAULT 'running' COMMENT 'running, completed, terminated, failed',
-  `task_params` TEXT COMMENT 'Task parameters (JSON)',
+  `task_params` JSON COMMENT 'Task parameters',
   `task_result` TEXT COMMENT 'Task result (JSON)',
   `error_message` TEXT COMMENT 'Error message',
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -132,6 +132,8 @@ CREATE TABLE IF NOT EXISTS `tasks` (
   INDEX `idx_user_id` (`user_id`),
   INDEX `idx_status` (`status`),
   INDEX `idx_created_at` (`created_at`),
+  INDEX `ix_task_user_status_created` (`user_id`, `status`, `created_at`),
+  INDEX `ix_task_user_created` (`user_id`, `created_at`),
   CONSTRAINT `fk_task_user` FOREIGN KEY (`user_id`) REFERENCES `users`(`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Async tasks';
 
@@ -175,6 +177,7 @@ CREATE TABLE IF NOT EXISTS `stock_trade_signals` (
   INDEX `idx_adopted` (`adopted`),
   INDEX `idx_related_transaction` (`related_transaction_id`),
   INDEX `idx_user_id` (`user_id`),
+  INDEX `ix_sig_symbol_model_date` (`symbol`, `model_name`, `date`),
   CONSTRAINT `fk_signal_transaction` FOREIGN KEY (`related_transaction_id`) REFERENCES `transactions`(`id`) ON DELETE SET NULL,
   CONSTRAINT `fk_signal_user` FOREIGN KEY (`user_id`) REFERENCES `users`(`id`) ON DELETE SET NULL,
   CONSTRAINT `unique_symbol_date_model_asset` UNIQUE (`symbol`, `date`, `model_name`, `asset_type`)
@@ -206,6 +209,7 @@ CREATE TABLE IF NOT EXISTS `tracking_stocks` (
   `buy_date` DATE NOT NULL COMMENT 'Date added to the list',
   `current_price` FLOAT COMMENT 'Latest cached price',
   `cost_amount` FLOAT COMMENT 'Actual capital invested',
+  `shares` FLOAT COMMENT 'Position size (cost_amount / buy_price)',
   `sector` VARCHAR(64) COMMENT 'GICS sector (e.g. Technology)',
   `industry` VARCHAR(128) COMMENT 'Sub-industry (e.g. Semiconductors)',
   `reason` TEXT COMMENT 'AI reasoning for buying',
@@ -229,10 +233,13 @@ CREATE TABLE IF NOT EXISTS `tracking_transactions` (
   `buy_price` FLOAT COMMENT 'Original buy price (for SELL)',
   `realized_pct` FLOAT COMMENT 'Realized return % (for SELL)',
   `cost_amount` FLOAT COMMENT 'Actual capital invested (for BUY)',
+  `shares` FLOAT COMMENT 'Position size bought/sold (cost_amount / buy price)',
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
   INDEX `idx_tt_symbol` (`symbol`),
   INDEX `idx_tt_action` (`action`),
-  INDEX `idx_tt_date` (`date`)
+  INDEX `idx_tt_date` (`date`),
+  INDEX `ix_tracking_txn_action_date` (`action`, `date`),
+  INDEX `ix_tracking_txn_date_id` (`date`, `id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Tracking portfolio buy/sell transactions';
 
 -- ============================================================
@@ -248,7 +255,8 @@ CREATE TABLE IF NOT EXISTS `tracking_daily_snapshots` (
   `realized_pnl` FLOAT NOT NULL DEFAULT 0 COMMENT 'Cumulative realized P&L',
   `holdings_json` TEXT COMMENT 'JSON snapshot of holdings at this date',
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  INDEX `idx_tds_date` (`date`)
+  INDEX `idx_tds_date` (`date`),
+  INDEX `ix_tracking_snapshot_date_values` (`date`, `total_return_pct`, `portfolio_value`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Daily portfolio value snapshots for charting';
 
 -- ============================================================
@@ -270,9 +278,22 @@ CREATE TABLE IF NOT EXISTS `tracking_decision_logs` (
   `accuracy_details` TEXT COMMENT 'JSON: per-action outcome details',
   `accuracy_evaluated_at` DATETIME COMMENT 'When the accuracy evaluation was done',
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  INDEX `idx_tdl_date` (`date`)
+  INDEX `idx_tdl_date` (`date`),
+  INDEX `ix_tracking_decision_date_id` (`date`, `id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='AI decision run logs with accuracy tracking';
 
+-- ============================================================
+-- 14. Benchmark Price Cache Table
+-- ============================================================
+CREATE TABLE IF NOT EXISTS `benchmark_price_cache` (
+  `id` INT AUTO_INCREMENT PRIMARY KEY,
+  `ticker` VARCHAR(16) NOT NULL COMMENT 'Benchmark ETF ticker (SPY, QQQ)',
+  `date` DATE NOT NULL COMMENT 'Trading date',
+  `close` FLOAT NOT NULL COMMENT 'Dividend-adjusted close',
+  `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  CONSTRAINT `unique_benchmark_ticker_date` UNIQUE (`ticker`, `date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Cached daily benchmark closes';
+
 -- ============================================================
 -- Display Table Information
 -- ============================================================